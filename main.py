@@ -1,7 +1,9 @@
 import asyncio
 import json
+import logging
 import os
 import sys
+from collections import OrderedDict
 from pathlib import Path
 from google import genai
 from decouple import config
@@ -10,9 +12,13 @@ from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
 
+# Diagnostics go to stderr through logging; only the agent's answers are printed
+logging.basicConfig(level=config("LOG_LEVEL", default="WARNING"))
+logger = logging.getLogger("invoice_agent")
+
 # Configuration
 GEMINI_API_KEY = config("GEMINI_API_KEY")
-print(f"🔑 GEMINI_API_KEY: {GEMINI_API_KEY}", file=sys.stderr)
+logger.debug("🔑 GEMINI_API_KEY loaded")
 if not GEMINI_API_KEY:
     raise ValueError("❌ GEMINI_API_KEY environment variable is required")
 
@@ -53,6 +59,21 @@ TOOLS = [
                     required=["description"]
                 )
             ),
+            types.FunctionDeclaration(
+                name="search_vectorized_products_batch",
+                description="Searches for several products at once by description using semantic embeddings. Prefer it over repeated search_vectorized_product calls when a request mentions multiple products.",
+                parameters=types.Schema(
+                    type="OBJECT",
+                    properties={
+                        "descriptions": types.Schema(
+                            type="ARRAY",
+                            items=types.Schema(type="STRING"),
+                            description="The product descriptions to search for"
+                        )
+                    },
+                    required=["descriptions"]
+                )
+            ),
             types.FunctionDeclaration(
                 name="resolve_ean",
                 description="Resolves the product's EAN code based on its description using advanced search techniques.",
@@ -82,16 +103,59 @@ TOOLS = [
     )
 ]
 
+# Request config is identical for every turn, so build it once
+GENERATE_CONFIG = types.GenerateContentConfig(
+    system_instruction=SYSTEM_PROMPT,
+    tools=TOOLS,
+    temperature=0.1
+)
+
 class MemoryState:
     """Conversation history for the modern SDK"""
-    def __init__(self):
+    def __init__(self, max_turns=8, max_tool_results=64):
         self.history = []
+        # Whole history is resent on every call; keep roughly the last max_turns
+        # exchanges (the system prompt is pinned separately in GENERATE_CONFIG)
+        self.max_entries = 2 * max_turns
+        # Results of tool calls already made this session, keyed by name + args;
+        # an LRU, so long sessions don't hold every tool payload
+        self.tool_results = OrderedDict()
+        self.max_tool_results = max_tool_results
+
+    @staticmethod
+    def _is_user_text(content):
+        return content.role == "user" and any(part.text for part in content.parts)
+
+    def _trim(self):
+        """Drop the oldest entries, cutting only where a user text message starts"""
+        excess = len(self.history) - self.max_entries
+        if excess <= 0:
+            return
+        # Any other cut could orphan a function_response from its function_call;
+        # if no safe cut exists yet, keep everything until one does
+        for start in range(excess, len(self.history)):
+            if self._is_user_text(self.history[start]):
+                del self.history[:start]
+                return
+
+    def cached_tool_result(self, key):
+        """Result of an identical earlier call, marked most recently used"""
+        self.tool_results.move_to_end(key)
+        return self.tool_results[key]
+
+    def cache_tool_result(self, key, result):
+        self.tool_results[key] = result
+        self.tool_results.move_to_end(key)
+        while len(self.tool_results) > self.max_tool_results:
+            self.tool_results.popitem(last=False)
 
     def add_user_message(self, content):
         self.history.append(types.Content(role="user", parts=[types.Part(text=content)]))
+        self._trim()
 
     def add_assistant_message(self, parts):
         self.history.append(types.Content(role="model", parts=parts))
+        self._trim()
 
     def add_tool_result(self, call_id, tool_name, result):
         """Add tool execution result to history"""
@@ -108,13 +172,46 @@ class MemoryState:
                 ]
             )
         )
+        self._trim()
 
-async def call_mcp_tool(mcp_session: ClientSession, tool_name: str, tool_input: dict) -> dict:
-    """Call a tool through the MCP server"""
+def tool_call_key(tool_name: str, tool_input: dict) -> str:
+    """Stable key for deduplicating identical tool calls within a session"""
+    return tool_name + json.dumps(tool_input, sort_keys=True, default=str)
+
+def parse_tool_text(text: str):
+    """FastMCP serializes dict/list tool results as JSON text"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def is_error_result(result) -> bool:
+    """A failed call, or a list tool's result carrying an error item"""
+    if isinstance(result, dict):
+        return "error" in result
+    if isinstance(result, list):
+        return any(isinstance(item, dict) and "error" in item for item in result)
+    return False
+
+async def call_mcp_tool(mcp_session: ClientSession, tool_name: str, tool_input: dict):
+    """Call a tool through the MCP server and return its result as structured data"""
     try:
         result = await mcp_session.call_tool(tool_name, tool_input)
-        # Assuming MCP server returns text/json in the first content block
-        return result.content[0].text if result.content else {}
+        texts = [block.text for block in result.content if block.type == "text"]
+        if result.isError:
+            return {"error": " ".join(texts)}
+        # Newer servers send the object itself; no JSON round trip needed
+        structured = getattr(result, "structuredContent", None)
+        if structured is not None:
+            # Non-object results (lists) arrive wrapped as {"result": [...]}
+            if isinstance(structured, dict) and list(structured) == ["result"]:
+                return structured["result"]
+            return structured
+        # Older FastMCP versions emit one text block per item of a list result
+        values = [parse_tool_text(text) for text in texts]
+        if not values:
+            return {}
+        return values[0] if len(values) == 1 else values
     except Exception as e:
         return {"error": str(e)}
 
@@ -122,22 +219,18 @@ async def run_agent_loop(mcp_session: ClientSession, query: str, memory_state: M
     """Modern ReAct Agent Loop"""
     memory_state.add_user_message(query)
     
-    print("\n🤖 Agent Processing...", file=sys.stderr)
+    logger.info("🤖 Agent Processing...")
     
     while True:
         try:
             # Generate content using history and tools
             response = client.models.generate_content(
                 model="gemini-2.0-flash",
-                config=types.GenerateContentConfig(
-                    system_instruction=SYSTEM_PROMPT,
-                    tools=TOOLS,
-                    temperature=0.1
-                ),
+                config=GENERATE_CONFIG,
                 contents=memory_state.history
             )
         except Exception as e:
-            print(f"❌ Error calling Gemini: {e}", file=sys.stderr)
+            logger.error("❌ Error calling Gemini: %s", e)
             break
 
         if not response.candidates:
@@ -157,18 +250,31 @@ async def run_agent_loop(mcp_session: ClientSession, query: str, memory_state: M
                     print(f"\n✅ Assistant: {part.text}", file=sys.stderr)
             break
 
-        # Process function calls
-        for fc in function_calls:
-            print(f"🔧 Tool: {fc.name} | Args: {fc.args}", file=sys.stderr)
-            
-            # Execute via MCP
-            result = await call_mcp_tool(mcp_session, fc.name, fc.args)
-            
-            # Feed back to history
+        # Process function calls concurrently: they are independent I/O, so the
+        # turn takes as long as the slowest tool rather than the sum of all.
+        # ClientSession multiplexes concurrent requests over the one stdio pipe.
+        keys = [tool_call_key(fc.name, fc.args) for fc in function_calls]
+        cached = {key: memory_state.cached_tool_result(key) for key in keys if key in memory_state.tool_results}
+        tasks = {}
+        async with asyncio.TaskGroup() as tg:
+            for fc, key in zip(function_calls, keys):
+                logger.info("🔧 Tool: %s | Args: %s", fc.name, fc.args)
+                # Execute via MCP, reusing the result of an identical earlier call
+                if key not in cached and key not in tasks:
+                    tasks[key] = tg.create_task(call_mcp_tool(mcp_session, fc.name, fc.args))
+
+        results = {key: task.result() for key, task in tasks.items()}
+        for key, result in results.items():
+            if not is_error_result(result):
+                memory_state.cache_tool_result(key, result)
+
+        # Feed back to history, in the order the model asked
+        for fc, key in zip(function_calls, keys):
+            result = results[key] if key in results else cached[key]
             memory_state.add_tool_result(None, fc.name, result)
 
 async def main():
-    print("🚀 Starting MCP Client...", file=sys.stderr)
+    logger.info("🚀 Starting MCP Client...")
     
     server_script = Path(__file__).parent / "server_invoice_items.py"
 
@@ -188,7 +294,7 @@ async def main():
                 
                 # 3. Initialize the Session (The Handshake)
                 await session.initialize()
-                print("✅ MCP Session Initialized", file=sys.stderr)
+                logger.info("✅ MCP Session Initialized")
                 
                 memory_state = MemoryState()
                 
@@ -204,7 +310,7 @@ async def main():
                         query = input("\nYou (type 'exit' to quit): ").strip()
                         
                         if query.lower() in ["quit", "exit", "bye"]:
-                            print("\n👋 Shutting down agent and closing MCP session...", file=sys.stderr)
+                            logger.info("👋 Shutting down agent and closing MCP session...")
                             break # Breaks out of 'while True', triggering the 'async with' exit
                             
                         if not query: continue
@@ -212,18 +318,16 @@ async def main():
                         await run_agent_loop(session, query, memory_state)
                         
                     except KeyboardInterrupt:
-                        print("\n\n⚠️  Interrupt detected. Cleaning up resources...", file=sys.stderr)
+                        logger.warning("⚠️  Interrupt detected. Cleaning up resources...")
                         break # Exit smoothly on Ctrl+C
                     except Exception as e:
-                        print(f"\n❌ Runtime Error: {e}", file=sys.stderr)
+                        logger.error("❌ Runtime Error: %s", e)
 
                 print("✅ Shutdown complete. Goodbye.", file=sys.stderr)
 
     except Exception as e:
-        print(f"\n❌ Connection failed: {e}", file=sys.stderr)
-        # If the server is spitting out errors, this will catch them
-        import traceback
-        traceback.print_exc()
+        # If the server is spitting out errors, the traceback will show them
+        logger.exception("❌ Connection failed: %s", e)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,30 +1,36 @@
 import oracledb
+from decouple import config
 
-# Port 1522 (verified by lsnrctl) 
-# Service xepdb1 (verified by lsnrctl)
-DSN = "localhost:1522/xepdb1" 
-
-print("🔌 Connecting to Local Oracle 21c XE...")
-
-try:
-    connection = oracledb.connect(
-        user="system",
-        password="oracle",
-        dsn=DSN
-    )
-    print("✅ Connected successfully to XEPDB1!")
-    
-    # Optional: Check if the products table is there
-    cursor = connection.cursor()
-    cursor.execute("SELECT table_name FROM user_tables WHERE table_name = 'PRODUCTS'")
-    cursor.execute("SELECT * FROM TABLE(fn_advanced_search('harry poter'))")
-    for row in cursor.fetchall():
-        print(f"Match Found: {row}")
-    row = cursor.fetchone()
-    if row:
-        print("📦 Table 'PRODUCTS' found!")
-    else:
-        print("⚠️ 'PRODUCTS' table not found in this schema.")
-        
-except oracledb.Error as e:
-    print(f"❌ Oracle Error: {e}")
\ No newline at end of file
+# Same .env settings as the rest of the project
+# (for a local 21c XE listener, e.g. ORACLE_DSN=localhost:1522/xepdb1)
+DSN = config('ORACLE_DSN')
+USERNAME = config('ORACLE_USER')
+PASSWORD = config('ORACLE_PASSWORD')
+
+
+def main():
+    """Opt-in connectivity check; importing this module does nothing."""
+    print(f"🔌 Connecting to {DSN}...")
+
+    try:
+        with oracledb.connect(user=USERNAME, password=PASSWORD, dsn=DSN) as connection:
+            print(f"✅ Connected successfully to {DSN}!")
+
+            # Optional: Check if the products table is there
+            cursor = connection.cursor()
+            cursor.execute("SELECT table_name FROM user_tables WHERE table_name = 'PRODUCTS'")
+            row = cursor.fetchone()
+            if row:
+                print("📦 Table 'PRODUCTS' found!")
+                cursor.execute("SELECT * FROM TABLE(fn_advanced_search('harry poter'))")
+                for row in cursor.fetchall():
+                    print(f"Match Found: {row}")
+            else:
+                print("⚠️ 'PRODUCTS' table not found in this schema.")
+
+    except oracledb.Error as e:
+        print(f"❌ Oracle Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -3,18 +3,20 @@ Generate and store semantic embeddings for products using Google's Generative AI
 Updated for google-genai SDK and Oracle 21c XE.
 """
 
+import array
+import asyncio
+import hashlib
 import os
 import sys
 from decouple import config
 import oracledb
 import numpy as np
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 
 
 # === GOOGLE AI CONFIGURATION ===
 GEMINI_API_KEY = config("GEMINI_API_KEY")
-print(GEMINI_API_KEY)
 
 if not GEMINI_API_KEY:
     print("❌ ERROR: GEMINI_API_KEY environment variable is required")
@@ -28,6 +30,25 @@ DB_DSN = config('ORACLE_DSN')
 USERNAME = config('ORACLE_USER')
 PASSWORD = config('ORACLE_PASSWORD')
 EMBEDDING_MODEL = "gemini-embedding-001" # Using the latest, more accurate model
+EMBEDDING_DIM = 768  # Requested output_dimensionality; must match VECTOR(768, FLOAT32)
+# Oracle 23ai: store embeddings in a native VECTOR column with an HNSW index
+# instead of a float32 BLOB (leave off for Oracle 21c XE)
+NATIVE_VECTOR = config('ORACLE_NATIVE_VECTOR', default=False, cast=bool)
+VECTOR_COLUMN_TYPE = f"VECTOR({EMBEDDING_DIM}, FLOAT32)" if NATIVE_VECTOR else "BLOB"
+# BLOB layout: float32, float16 (2x smaller) or int8 with a per-vector float32 scale (4x smaller).
+# The VECTOR column is always FLOAT32.
+STORAGE_DTYPE = "float32" if NATIVE_VECTOR else config('VECTOR_STORAGE_DTYPE', default='float16')
+if STORAGE_DTYPE not in ("float32", "float16", "int8"):
+    print(f"❌ ERROR: Unsupported VECTOR_STORAGE_DTYPE '{STORAGE_DTYPE}' (use float32, float16 or int8)")
+    sys.exit(1)
+# Descriptions longer than CHUNK_WINDOW words are also embedded as overlapping
+# windows in product_chunks so tail content isn't lost in a single vector
+CHUNK_WINDOW = 150
+CHUNK_STRIDE = 100
+EMBED_BATCH_SIZE = 100  # Max contents per embed_content request
+EMBED_CONCURRENCY = 8  # Embedding workers, i.e. batches in flight against the Gemini endpoint
+FETCH_ARRAYSIZE = 1000  # Product rows fetched from Oracle per round trip
+EMBED_MAX_RETRIES = 5  # Exponential backoff attempts on 429/503
 
 print("="*60)
 print("📊 Product Vector Embedding Generator (Modern SDK)")
@@ -35,94 +56,85 @@ print("="*60)
 print(f"🔌 Database: {DB_DSN}")
 print(f"👤 User: {USERNAME}")
 print(f"🤖 Embedding Model: {EMBEDDING_MODEL}")
+print(f"🧮 Vector Storage: {VECTOR_COLUMN_TYPE} ({STORAGE_DTYPE})")
 print("="*60)
 
 # === CONNECTING TO ORACLE ===
+
+
+def init_session(conn, requested_tag):
+    """Runs once per new pooled session instead of on every acquire."""
+    # Ensure we are working in the BOOKSTORE schema; the setting rides along with
+    # the session's first call rather than costing an ALTER SESSION round trip
+    conn.current_schema = "BOOKSTORE"
+
+
 try:
-    connection = oracledb.connect(
+    pool = oracledb.create_pool(
         user=USERNAME,
         password=PASSWORD,
-        dsn=DB_DSN
+        dsn=DB_DSN,
+        min=2,
+        max=8,
+        increment=2,
+        session_callback=init_session
     )
+    connection = pool.acquire()
     cursor = connection.cursor()
-    # Ensure we are working in the BOOKSTORE schema
-    cursor.execute("ALTER SESSION SET CURRENT_SCHEMA = BOOKSTORE")
     print(f"✅ Connected and switched to BOOKSTORE schema")
 
 except Exception as e:
     print(f"❌ Failed to connect to Oracle: {e}")
     sys.exit(1)
 
-# === FETCH PRODUCTS FROM DATABASE ===
-try:
-    # Fetching from the PRODUCTS table
-    cursor.execute("SELECT id, code, description FROM products ORDER BY id")
-    rows = cursor.fetchall()
-    print(f"✅ Retrieved {len(rows)} products from BOOKSTORE.PRODUCTS")
-except Exception as e:
-    print(f"❌ Error fetching products: {e}")
-    cursor.close()
-    connection.close()
-    sys.exit(1)
-
-if not rows:
-    print("⚠️ No products found in 'products' table.")
-    cursor.close()
-    connection.close()
-    sys.exit(1)
-
-ids_codes = [(row[0], row[1]) for row in rows]
-descriptions = [row[2] for row in rows]
-
-# === GENERATE EMBEDDINGS USING GOOGLE API ===
-
-print("\n📈 Generating embeddings via Google Gemini...")
-embeddings = []
-
-try:
-    # We loop to handle potential individual errors, but the SDK also supports batching
-    for i, description in enumerate(descriptions, 1):
-        try:
-            # Modern SDK Call
-            response = client.models.embed_content(
-                model=EMBEDDING_MODEL,
-                contents=description,
-                config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT")
-            )
-
-            # Extract the vector values from the first embedding object
-            # Note: response.embeddings[0].values returns a list of floats
-            embedding_list = response.embeddings[0].values
-            embedding_np = np.array(embedding_list, dtype=np.float32)
-            embeddings.append(embedding_np)
-            
-            if i % 10 == 0 or i == len(descriptions):
-                print(f"   ✓ Embedded {i}/{len(descriptions)} products")
-        except Exception as e:
-            print(f"❌ Error embedding product {i}: {e}")
-            # Use 768 for embedding-001 or 768 for text-embedding-004 (configurable)
-            embeddings.append(np.zeros(768, dtype=np.float32)) 
-
-    print(f"✅ Generated embeddings for {len(embeddings)} products")
-except Exception as e:
-    print(f"❌ Error during embedding generation: {e}")
-    cursor.close()
-    connection.close()
-    sys.exit(1)
-
 # === CREATE EMBEDDINGS TABLE IF NOT EXISTS ===
-print("\n📋 Creating 'embeddings_products' table...")
+print("\n📋 Creating 'embeddings_products' and 'product_chunks' tables...")
 try:
-    cursor.execute("""
+    cursor.execute(f"""
         BEGIN
             EXECUTE IMMEDIATE '
                 CREATE TABLE embeddings_products (
                     id NUMBER PRIMARY KEY,
                     code VARCHAR2(100),
                     description VARCHAR2(4000),
-                    vector BLOB
+                    vector {VECTOR_COLUMN_TYPE},
+                    dtype VARCHAR2(10),
+                    desc_hash RAW(16)
+                )
+            ';
+        EXCEPTION
+            WHEN OTHERS THEN
+                IF SQLCODE != -955 THEN
+                    RAISE;
+                END IF;
+        END;
+    """)
+    # Tables created by earlier versions of this script lack the newer columns
+    # (a NULL dtype means float32 BLOBs, a NULL desc_hash forces re-embedding)
+    for column in ("dtype VARCHAR2(10)", "desc_hash RAW(16)"):
+        cursor.execute(f"""
+            BEGIN
+                EXECUTE IMMEDIATE 'ALTER TABLE embeddings_products ADD ({column})';
+            EXCEPTION
+                WHEN OTHERS THEN
+                    IF SQLCODE != -1430 THEN
+                        RAISE;
+                    END IF;
+            END;
+        """)
+    cursor.execute(f"""
+        BEGIN
+            EXECUTE IMMEDIATE '
+                CREATE TABLE product_chunks (
+                    chunk_id NUMBER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+                    product_id NUMBER NOT NULL REFERENCES embeddings_products (id) ON DELETE CASCADE,
+                    chunk_no NUMBER NOT NULL,
+                    chunk_text VARCHAR2(4000),
+                    vector {VECTOR_COLUMN_TYPE},
+                    dtype VARCHAR2(10)
                 )
             ';
+            EXECUTE IMMEDIATE 'CREATE INDEX idx_product_chunks_product ON product_chunks (product_id)';
         EXCEPTION
             WHEN OTHERS THEN
                 IF SQLCODE != -955 THEN
@@ -130,44 +142,277 @@ try:
                 END IF;
         END;
     """)
-    print("✅ Table ready.")
+    print("✅ Tables ready.")
 except Exception as e:
     print(f"⚠️ Table operation: {e}")
 
+# === GENERATE EMBEDDINGS USING GOOGLE API ===
+
+
+def is_retryable(error):
+    """Rate limiting and transient unavailability are worth retrying."""
+    return isinstance(error, errors.APIError) and error.code in (429, 503)
+
+
+async def embed_batch(batch):
+    """Embed a list of texts with a single API call, backing off on 429/503; returns one row per text."""
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            response = await client.aio.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=batch,
+                config=types.EmbedContentConfig(
+                    task_type="RETRIEVAL_DOCUMENT",
+                    output_dimensionality=EMBEDDING_DIM
+                )
+            )
+            # google-genai returns plain float lists: stack the batch into one
+            # (B, D) float32 array in a single conversion
+            vectors = np.asarray([e.values for e in response.embeddings], dtype=np.float32)
+            # Truncated (non-3072) Gemini embeddings are not unit length
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            return list(vectors)
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES or not is_retryable(e):
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+
+async def embed_batch_or_items(start, batch):
+    """
+    Embed one batch; on failure retry item by item so a single bad row doesn't
+    poison the batch. Texts that still fail come back as None.
+    """
+    try:
+        return await embed_batch(batch)
+    except Exception as e:
+        print(f"⚠️ Batch starting at text {start + 1} failed ({e}), retrying individually...")
+
+    vectors = []
+    for i, text in enumerate(batch, start + 1):
+        try:
+            vectors.extend(await embed_batch([text]))
+        except Exception as e:
+            print(f"❌ Error embedding text {i}: {e}")
+            vectors.append(None)
+    return vectors
+
+
+def split_into_chunks(description):
+    """
+    Overlapping CHUNK_WINDOW-word windows every CHUNK_STRIDE words.
+    Whitespace words stand in for model tokens; short descriptions are one chunk.
+    """
+    words = description.split()
+    if len(words) <= CHUNK_WINDOW:
+        return [description]
+    return [
+        " ".join(words[start:start + CHUNK_WINDOW])
+        for start in range(0, len(words) - CHUNK_WINDOW + CHUNK_STRIDE, CHUNK_STRIDE)
+    ]
+
 # === INSERT OR UPDATE EMBEDDINGS ===
-print("\n💾 Storing embeddings in database...")
+
+
+def description_hash(description):
+    """
+    Fingerprint of everything that shapes a stored embedding; unchanged
+    products are skipped instead of being sent to Gemini again.
+    """
+    settings = f"{EMBEDDING_MODEL}|{EMBEDDING_DIM}|{STORAGE_DTYPE}|{CHUNK_WINDOW}|{CHUNK_STRIDE}|"
+    return hashlib.blake2b((settings + description).encode('utf-8'), digest_size=16).digest()
+
+
+def encode_vector(vector):
+    """Serialize a vector for the vector column according to STORAGE_DTYPE."""
+    if NATIVE_VECTOR:
+        # python-oracledb binds array('f') to the VECTOR type
+        return array.array('f', vector.tobytes())
+    if STORAGE_DTYPE == "int8":
+        # Per-vector float32 scale followed by the int8 codes
+        scale = np.float32(max(np.abs(vector).max(), 1e-12) / 127)
+        codes = np.round(vector / scale).astype(np.int8)
+        return scale.tobytes() + codes.tobytes()
+    return vector.astype(STORAGE_DTYPE).tobytes()
+
+
+def store_batch(write_cursor, chunk_cursor, rows, chunk_rows):
+    """
+    MERGE one batch of product embeddings and replace their chunks, each in a
+    single array-DML round trip; returns product rows stored.
+    """
+    write_cursor.executemany("""
+        MERGE INTO embeddings_products tgt
+        USING (SELECT :id AS id FROM dual) src
+        ON (tgt.id = src.id)
+        WHEN MATCHED THEN
+            UPDATE SET code = :code, description = :description, vector = :vector,
+                       dtype = :dtype, desc_hash = :desc_hash
+        WHEN NOT MATCHED THEN
+            INSERT (id, code, description, vector, dtype, desc_hash)
+            VALUES (:id, :code, :description, :vector, :dtype, :desc_hash)
+    """, rows, batcherrors=True)
+
+    batch_errors = write_cursor.getbatcherrors()
+    failed_ids = set()
+    for error in batch_errors:
+        failed_ids.add(rows[error.offset]["id"])
+        print(f"❌ Error storing embedding for product id {rows[error.offset]['id']}: {error.message}")
+    # A product whose MERGE failed keeps its old row and chunks
+    stored_ids = [[row["id"]] for row in rows if row["id"] not in failed_ids]
+    chunk_rows = [chunk_row for chunk_row in chunk_rows if chunk_row[0] not in failed_ids]
+
+    # Descriptions may have shrunk since the last run, so drop every old chunk
+    # (on its own cursor, chunk_cursor carries the INSERT bind sizes)
+    if stored_ids:
+        with chunk_cursor.connection.cursor() as purge_cursor:
+            purge_cursor.executemany("DELETE FROM product_chunks WHERE product_id = :1", stored_ids)
+    if chunk_rows:
+        chunk_cursor.executemany("""
+            INSERT INTO product_chunks (product_id, chunk_no, chunk_text, vector, dtype)
+            VALUES (:1, :2, :3, :4, :5)
+        """, chunk_rows, batcherrors=True)
+        for error in chunk_cursor.getbatcherrors():
+            product_id, chunk_no = chunk_rows[error.offset][:2]
+            print(f"❌ Error storing chunk {chunk_no} for product id {product_id}: {error.message}")
+    return len(rows) - len(batch_errors)
+
+
+async def embed_and_store(read_cursor, write_cursor, chunk_cursor):
+    """
+    Stream products from Oracle through a bounded queue to EMBED_CONCURRENCY workers,
+    each embedding and storing one batch at a time, so memory stays constant
+    regardless of catalog size. Products whose description_hash matches the
+    stored one are skipped. Returns (products read, embeddings stored, skipped).
+    """
+    queue = asyncio.Queue(maxsize=2 * EMBED_CONCURRENCY)
+    counts = {"read": 0, "queued": 0, "stored": 0, "skipped": 0}
+
+    async def produce():
+        # Oracle round trips happen once per FETCH_ARRAYSIZE rows; iteration
+        # is served from the prefetch buffer in between
+        read_cursor.execute("""
+            SELECT p.id, p.code, p.description, e.desc_hash
+            FROM products p
+            LEFT JOIN embeddings_products e ON p.id = e.id
+            ORDER BY p.id
+        """)
+        pending = []
+        for id_, code, description, stored_hash in read_cursor:
+            counts["read"] += 1
+            if description is None:
+                print(f"⚠️ Product id {id_} has no description, not embedded")
+                continue
+            desc_hash = description_hash(description)
+            if desc_hash == stored_hash:
+                counts["skipped"] += 1
+                continue
+            pending.append((id_, code, description, desc_hash))
+            if len(pending) == EMBED_BATCH_SIZE:
+                await queue.put((counts["queued"], pending))
+                counts["queued"] += len(pending)
+                pending = []
+        if pending:
+            await queue.put((counts["queued"], pending))
+        for _ in range(EMBED_CONCURRENCY):
+            await queue.put(None)
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            start, rows = item
+            chunked = [split_into_chunks(row[2]) for row in rows]
+            texts = [chunk for chunks in chunked for chunk in chunks]
+            vectors = []
+            for offset in range(0, len(texts), EMBED_BATCH_SIZE):
+                vectors.extend(await embed_batch_or_items(offset, texts[offset:offset + EMBED_BATCH_SIZE]))
+
+            product_rows, chunk_rows = [], []
+            position = 0
+            for (id_, code, description, desc_hash), chunks in zip(rows, chunked):
+                chunk_vectors = vectors[position:position + len(chunks)]
+                position += len(chunks)
+                if any(v is None for v in chunk_vectors):
+                    # Not stored: an earlier embedding survives, and the stale (or
+                    # missing) hash makes the next run retry the product
+                    print(f"⚠️ Product id {id_} not stored, it will be retried on the next run")
+                    continue
+                if len(chunks) == 1:
+                    vector = chunk_vectors[0]
+                else:
+                    # The product row keeps a single representative vector for readers
+                    # that don't look at product_chunks
+                    vector = np.mean(chunk_vectors, axis=0)
+                    vector /= np.linalg.norm(vector) + 1e-12
+                    chunk_rows.extend(
+                        [id_, chunk_no, chunk, encode_vector(chunk_vector), STORAGE_DTYPE]
+                        for chunk_no, (chunk, chunk_vector) in enumerate(zip(chunks, chunk_vectors))
+                    )
+                product_rows.append({"id": id_, "code": code, "description": description,
+                                     "vector": encode_vector(vector), "dtype": STORAGE_DTYPE,
+                                     "desc_hash": desc_hash})
+
+            if product_rows:
+                counts["stored"] += store_batch(write_cursor, chunk_cursor, product_rows, chunk_rows)
+            print(f"   ✓ Embedded changed products {start + 1}-{start + len(rows)}")
+
+    await asyncio.gather(produce(), *[consume() for _ in range(EMBED_CONCURRENCY)])
+    return counts["read"], counts["stored"], counts["skipped"]
+
+
+print("\n📈 Generating and storing embeddings via Google Gemini...")
+write_cursor = connection.cursor()
+chunk_cursor = connection.cursor()
 try:
-    for i, (id_code, vector) in enumerate(zip(ids_codes, embeddings)):
-        id_, code = id_code
-        description = descriptions[i]
-        
-        # Convert the float32 numpy array to raw bytes for BLOB storage
-        vector_bytes = vector.tobytes()
-        
-        cursor.execute("""
-            MERGE INTO embeddings_products tgt
-            USING (SELECT :id AS id FROM dual) src
-            ON (tgt.id = src.id)
-            WHEN MATCHED THEN
-                UPDATE SET code = :code, description = :description, vector = :vector
-            WHEN NOT MATCHED THEN
-                INSERT (id, code, description, vector)
-                VALUES (:id, :code, :description, :vector)
-        """, {
-            "id": id_,
-            "code": code,
-            "description": description,
-            "vector": vector_bytes
-        })
+    # Declare bind types once so oracledb doesn't re-describe them per row
+    vector_type = oracledb.DB_TYPE_VECTOR if NATIVE_VECTOR else oracledb.DB_TYPE_BLOB
+    write_cursor.setinputsizes(id=int, code=100, description=4000, vector=vector_type, dtype=10,
+                               desc_hash=oracledb.DB_TYPE_RAW)
+    chunk_cursor.setinputsizes(int, int, 4000, vector_type, 10)
+
+    # Products are streamed on a second pooled session so fetches don't queue
+    # behind the MERGEs running on the main one
+    with pool.acquire() as read_connection, read_connection.cursor() as read_cursor:
+        read_cursor.arraysize = FETCH_ARRAYSIZE
+        read_cursor.prefetchrows = FETCH_ARRAYSIZE + 1
+        read_count, stored_count, skipped_count = asyncio.run(embed_and_store(read_cursor, write_cursor, chunk_cursor))
+    if not read_count:
+        print("⚠️ No products found in 'products' table.")
+        sys.exit(1)
 
     connection.commit()
-    print(f"✅ Stored {len(embeddings)} embeddings successfully.")
+    print(f"✅ Stored {stored_count} embeddings successfully ({skipped_count}/{read_count} products unchanged, skipped).")
+
+    if NATIVE_VECTOR:
+        # k-NN runs inside the database through VECTOR_DISTANCE + this index
+        print("\n🧭 Creating HNSW vector indexes...")
+        for index_name, table_name in (("emb_hnsw", "embeddings_products"), ("emb_chunks_hnsw", "product_chunks")):
+            try:
+                cursor.execute(f"""
+                    BEGIN
+                        EXECUTE IMMEDIATE '
+                            CREATE VECTOR INDEX {index_name} ON {table_name} (vector)
+                            ORGANIZATION INMEMORY NEIGHBOR GRAPH
+                            DISTANCE COSINE
+                        ';
+                    EXCEPTION
+                        WHEN OTHERS THEN
+                            IF SQLCODE != -955 THEN
+                                RAISE;
+                            END IF;
+                    END;
+                """)
+                print(f"✅ Vector index {index_name} ready.")
+            except Exception as e:
+                print(f"⚠️ Vector index operation ({index_name}): {e}")
 except Exception as e:
-    print(f"❌ Error storing embeddings: {e}")
+    print(f"❌ Error generating or storing embeddings: {e}")
     connection.rollback()
 finally:
+    chunk_cursor.close()
+    write_cursor.close()
     cursor.close()
-    connection.close()
+    pool.release(connection)
+    pool.close()
 
 print("\n" + "="*60)
 print("✅ Vector embedding process completed successfully!")
@@ -1,31 +1,69 @@
+import array
+import hashlib
+import json
 import os
 import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
 import oracledb
 import numpy as np
-import difflib
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
 from decouple import config
 from google import genai
 from google.genai import types
 
+try:
+    import faiss
+except ImportError:  # Optional: without it the exact matmul scan is used
+    faiss = None
+
+# Read once at import; GOOGLE_API_KEY is the name setup.ipynb uses
+GEMINI_API_KEY = config("GEMINI_API_KEY", default="") or config("GOOGLE_API_KEY", default="")
+
+_genai_client = None
+_genai_client_lock = threading.Lock()
+
+
+def get_genai_client():
+    """One Gemini client per process, shared by every searcher so HTTP connections are reused."""
+    global _genai_client
+    with _genai_client_lock:
+        if _genai_client is None:
+            if not GEMINI_API_KEY:
+                raise ValueError("❌ GEMINI_API_KEY (or GOOGLE_API_KEY) is missing")
+            _genai_client = genai.Client(api_key=GEMINI_API_KEY)
+    return _genai_client
+
 class SearchSimilarProduct:
-    def __init__(self, top_k=5, minimal_distance=1.0, embedding_model="gemini-embedding-001"):
-        api_key = config("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("❌ GEMINI_API_KEY is missing")
-        
-        self.client = genai.Client(api_key=api_key)
+    def __init__(self, top_k=5, minimal_distance=1.0, minimal_fuzzy_score=60, embedding_model="gemini-embedding-001", embedding_dim=768):
+        self.client = get_genai_client()
         self.db_dsn = config("ORACLE_DSN")
         self.username = config("ORACLE_USER")
         self.password = config("ORACLE_PASSWORD")
         self.top_k = top_k
         self.minimal_distance = minimal_distance
+        self.minimal_fuzzy_score = minimal_fuzzy_score
         self.embedding_model = embedding_model
+        self.embedding_dim = embedding_dim
+        # Below this many vectors the exact matmul scan beats an ANN lookup
+        self.ann_min_vectors = config("ANN_MIN_VECTORS", default=10000, cast=int)
+        self.index = None
+        # Set to keep a memory-mapped copy of the vectors between server starts
+        self.vector_cache_dir = config("EMBEDDING_CACHE_DIR", default="")
+        # Oracle 23ai: run k-NN in the database against the VECTOR column
+        self.native_vector = config("ORACLE_NATIVE_VECTOR", default=False, cast=bool)
+        # Per-process LRU of query embeddings; only successful lookups are cached
+        self.embed_cache_size = config("EMBED_CACHE_SIZE", default=10000, cast=int)
+        self.embed_batch_size = 100  # Max contents per embed_content request
+        self._embedding_cache = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
 
         try:
             self.conn = oracledb.connect(user=self.username, password=self.password, dsn=self.db_dsn)
-            with self.conn.cursor() as cursor:
-                cursor.execute("ALTER SESSION SET CURRENT_SCHEMA = BOOKSTORE")
+            # Sent along with the first query instead of a separate ALTER SESSION round trip
+            self.conn.current_schema = "BOOKSTORE"
             # Redirecting to stderr ensures MCP JSON-RPC on stdout isn't corrupted
             print(f"DEBUG: Connected to Oracle (BOOKSTORE)", file=sys.stderr)
         except Exception as e:
@@ -37,57 +75,335 @@ class SearchSimilarProduct:
     def _load_embeddings(self):
         try:
             with self.conn.cursor() as cursor:
-                cursor.execute("SELECT id, code, description, vector FROM embeddings_products")
                 self.vectors = []
                 self.products = []
-                for row in cursor.fetchall():
-                    if row[3]:
-                        vector = np.frombuffer(row[3].read(), dtype=np.float32)
-                        self.vectors.append(vector)
-                        self.products.append({"id": row[0], "code": row[1], "description": row[2]})
-                self.vectors = np.array(self.vectors)
-                print(f"DEBUG: Loaded {len(self.products)} vectors", file=sys.stderr)
+                self._descriptions = []
+                self._sorted_descriptions = []
+                if self.native_vector:
+                    # Vectors stay in Oracle; only the catalog is needed for input correction
+                    cursor.execute("SELECT id, code, description FROM embeddings_products WHERE vector IS NOT NULL")
+                    self.products = [{"id": row[0], "code": row[1], "description": row[2]} for row in cursor]
+                    self._prepare_descriptions()
+                    print(f"DEBUG: Loaded {len(self.products)} products (vectors in database)", file=sys.stderr)
+                    return
+                # BLOBs arrive inline with each fetched batch instead of one LOB read per row
+                cursor.arraysize = 1000
+                cursor.outputtypehandler = self._blobs_as_bytes
+                cursor.execute("SELECT COUNT(*), MAX(ORA_ROWSCN) FROM embeddings_products WHERE vector IS NOT NULL")
+                product_count, product_scn = cursor.fetchone()
+                try:
+                    cursor.execute("SELECT COUNT(*), MAX(ORA_ROWSCN) FROM product_chunks WHERE vector IS NOT NULL")
+                    chunk_count, chunk_scn = cursor.fetchone()
+                except oracledb.DatabaseError as e:
+                    # Embeddings generated before chunking was introduced
+                    print(f"DEBUG: No product chunks loaded: {e}", file=sys.stderr)
+                    chunk_count, chunk_scn = 0, None
+
+                # Storing, updating or deleting any vector changes this fingerprint
+                fingerprint = [self.embedding_model, self.embedding_dim,
+                               product_count, product_scn, chunk_count, chunk_scn]
+                if not self._read_vector_cache(fingerprint):
+                    self._fetch_vectors(cursor, product_count, chunk_count)
+                    self._build_index()
+                    self._write_vector_cache(fingerprint)
+                self._prepare_descriptions()
+                print(f"DEBUG: Loaded {len(self.products)} products, {len(self.vectors)} vectors", file=sys.stderr)
         except Exception as e:
             print(f"DEBUG: Load Error: {e}", file=sys.stderr)
 
-    def _embed_text(self, text):
+    def _fetch_vectors(self, cursor, product_count, chunk_count):
+        """Stream every stored product and chunk vector from Oracle."""
+        # One preallocated contiguous (N, D) float32 matrix, filled in place; with
+        # unit rows scoring is a single BLAS matrix-vector product
+        vectors = np.empty((product_count + chunk_count, self.embedding_dim), dtype=np.float32)
+        owners = np.empty(len(vectors), dtype=np.int64)
+        filled = 0
+        cursor.execute("SELECT id, code, description, vector, dtype FROM embeddings_products WHERE vector IS NOT NULL")
+        for id_, code, description, raw, dtype in cursor:
+            if filled == product_count:
+                break  # Rows stored after the count are picked up on the next load
+            vectors[filled] = self._decode_vector(raw, dtype)
+            owners[filled] = filled
+            self.products.append({"id": id_, "code": code, "description": description})
+            filled += 1
+
+        # Chunks of long descriptions score on behalf of their product
+        if chunk_count:
+            positions = {p["id"]: i for i, p in enumerate(self.products)}
+            cursor.execute("SELECT product_id, vector, dtype FROM product_chunks WHERE vector IS NOT NULL")
+            for product_id, raw, dtype in cursor:
+                if filled == len(vectors):
+                    break
+                if product_id in positions:
+                    vectors[filled] = self._decode_vector(raw, dtype)
+                    owners[filled] = positions[product_id]
+                    filled += 1
+
+        self.vectors = vectors[:filled]
+        # Quantized rows are only approximately unit length; row norms come from
+        # einsum so normalizing doesn't allocate another (N, D) temporary
+        norms = np.sqrt(np.einsum("ij,ij->i", self.vectors, self.vectors))
+        self.vectors /= np.maximum(norms, 1e-12)[:, None]
+        self.vector_owners = owners[:filled]
+
+    def _build_index(self):
+        if faiss is not None and len(self.vectors) >= self.ann_min_vectors:
+            # Inner product on unit rows is cosine similarity; the graph walks int8
+            # codes (a quarter of the float32 bytes) and candidates are re-scored exactly
+            self.index = faiss.IndexHNSWSQ(self.vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, 32,
+                                           faiss.METRIC_INNER_PRODUCT)
+            self.index.train(self.vectors)
+            self.index.add(self.vectors)
+
+    def _vector_cache_path(self):
+        """Cache directory for this DSN and user, or None when EMBEDDING_CACHE_DIR is unset."""
+        if not self.vector_cache_dir:
+            return None
+        key = hashlib.blake2b(f"{self.db_dsn}|{self.username}".encode("utf-8"), digest_size=8).hexdigest()
+        return Path(self.vector_cache_dir) / key
+
+    def _read_vector_cache(self, fingerprint):
+        """Map the vectors saved by an earlier start if the database hasn't changed since."""
+        path = self._vector_cache_path()
+        if path is None:
+            return False
+        try:
+            with open(path / "meta.json", encoding="utf-8") as f:
+                if json.load(f) != fingerprint:
+                    return False
+            with open(path / "products.json", encoding="utf-8") as f:
+                self.products = json.load(f)
+            # Pages are read on demand instead of streaming every BLOB from Oracle
+            self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+            self.vector_owners = np.load(path / "owners.npy")
+            index_file = path / "index.faiss"
+            if faiss is not None and len(self.vectors) >= self.ann_min_vectors and index_file.exists():
+                self.index = faiss.read_index(str(index_file))
+            else:
+                self._build_index()
+        except (OSError, ValueError, RuntimeError) as e:
+            # faiss.read_index raises RuntimeError on a truncated or incompatible index
+            print(f"DEBUG: Vector cache unreadable: {e}", file=sys.stderr)
+            self.products = []
+            return False
+        print(f"DEBUG: Vectors mapped from cache {path}", file=sys.stderr)
+        return True
+
+    def _write_vector_cache(self, fingerprint):
+        path = self._vector_cache_path()
+        if path is None:
+            return
         try:
-            response = self.client.models.embed_content(
-                model=self.embedding_model,
-                contents=text,
-                config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY")
+            path.mkdir(parents=True, exist_ok=True)
+            # Each file is swapped in whole, so servers still mapping the old one are
+            # unaffected; meta.json goes last and marks the set complete
+            (path / "meta.json").unlink(missing_ok=True)
+            self._replace_file(path / "vectors.npy", lambda f: np.save(f, self.vectors))
+            self._replace_file(path / "owners.npy", lambda f: np.save(f, self.vector_owners))
+            self._replace_file(path / "products.json", lambda f: f.write(json.dumps(self.products).encode("utf-8")))
+            if self.index is not None:
+                self._replace_file(path / "index.faiss", lambda f: f.write(faiss.serialize_index(self.index).tobytes()))
+            else:
+                (path / "index.faiss").unlink(missing_ok=True)
+            self._replace_file(path / "meta.json", lambda f: f.write(json.dumps(fingerprint).encode("utf-8")))
+        except OSError as e:
+            print(f"DEBUG: Vector cache not written: {e}", file=sys.stderr)
+
+    @staticmethod
+    def _replace_file(path, write):
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _blobs_as_bytes(cursor, metadata):
+        """Fetch BLOB columns as bytes, avoiding a LOB locator round trip per row."""
+        if metadata.type_code is oracledb.DB_TYPE_BLOB:
+            return cursor.var(oracledb.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize)
+
+    @staticmethod
+    def _decode_vector(raw, dtype):
+        """Unpack a BLOB written by process_vector_products.py (NULL dtype means legacy float32)."""
+        if dtype == "int8":
+            # Per-vector float32 scale followed by the int8 codes
+            scale = np.frombuffer(raw, dtype=np.float32, count=1)[0]
+            return np.frombuffer(raw, dtype=np.int8, offset=4).astype(np.float32) * scale
+        # Rows are copied into the preallocated matrix, so float32 needs no copy here
+        return np.frombuffer(raw, dtype=dtype or "float32").astype(np.float32, copy=False)
+
+    def _request_embeddings(self, texts):
+        """Embed a list of texts with a single API call; returns one read-only row per text."""
+        response = self.client.models.embed_content(
+            model=self.embedding_model,
+            contents=texts,
+            config=types.EmbedContentConfig(
+                # Pairs with RETRIEVAL_DOCUMENT used for the stored product vectors
+                task_type="RETRIEVAL_QUERY",
+                output_dimensionality=self.embedding_dim
             )
-            return np.array(response.embeddings[0].values)
+        )
+        # float32 like the stored matrix, so scoring never upcasts it to float64
+        embs = np.array([e.values for e in response.embeddings], dtype=np.float32)
+        # Stored vectors are unit length; truncated Gemini embeddings are not
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
+        # The same rows are handed out on every cache hit
+        embs.setflags(write=False)
+        return list(embs)
+
+    def _embed_texts(self, texts):
+        """
+        Embeddings for several texts: cache misses share one embed_content call
+        per embed_batch_size texts. Returns None if the request fails.
+        """
+        keys = [" ".join(text.split()) for text in texts]
+        with self._embedding_cache_lock:
+            found = {key: self._embedding_cache[key] for key in keys if key in self._embedding_cache}
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        try:
+            for start in range(0, len(missing), self.embed_batch_size):
+                batch = missing[start:start + self.embed_batch_size]
+                found.update(zip(batch, self._request_embeddings(batch)))
         except Exception as e:
             print(f"DEBUG: Embedding Error: {e}", file=sys.stderr)
             return None
 
+        with self._embedding_cache_lock:
+            for key in keys:
+                # Re-inserting marks the entry most recently used
+                self._embedding_cache.pop(key, None)
+                self._embedding_cache[key] = found[key]
+            while len(self._embedding_cache) > self.embed_cache_size:
+                self._embedding_cache.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def _nearest_in_database(self, emb):
+        """
+        Top-k by cosine distance computed by Oracle (served by the HNSW indexes).
+        Product and chunk neighbours are rolled up to the best distance per product.
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT e.id, e.code, e.description, MIN(n.distance)
+                FROM (
+                    (SELECT id AS product_id, VECTOR_DISTANCE(vector, :q, COSINE) AS distance
+                     FROM embeddings_products
+                     ORDER BY VECTOR_DISTANCE(vector, :q, COSINE)
+                     FETCH APPROX FIRST :k ROWS ONLY)
+                    UNION ALL
+                    (SELECT product_id, VECTOR_DISTANCE(vector, :q, COSINE)
+                     FROM product_chunks
+                     ORDER BY VECTOR_DISTANCE(vector, :q, COSINE)
+                     FETCH APPROX FIRST :k ROWS ONLY)
+                ) n
+                JOIN embeddings_products e ON e.id = n.product_id
+                GROUP BY e.id, e.code, e.description
+                ORDER BY MIN(n.distance)
+                FETCH FIRST :k ROWS ONLY
+            """, q=array.array('f', emb.tobytes()), k=self.top_k)
+            # Report the Euclidean distance between unit vectors, like the in-memory path
+            return [({"id": row[0], "code": row[1], "description": row[2]}, float(np.sqrt(2 * max(0.0, row[3]))))
+                    for row in cursor]
+
+    def _nearest_in_index(self, emb):
+        """
+        Top-k through the quantized HNSW index. Chunks share their product's slot, so
+        extra neighbours are requested, re-scored against the float32 vectors and
+        rolled up to the best score per product.
+        """
+        k = min(len(self.vectors), max(100, self.top_k * max(1, len(self.vectors) // len(self.products)) * 2))
+        _, ids = self.index.search(emb.reshape(1, -1), k)
+        ids = ids[0][ids[0] >= 0]
+        scores = self.vectors[ids] @ emb
+        order = np.argsort(-scores)
+        best = {}
+        for idx, score in zip(ids[order], scores[order]):
+            owner = int(self.vector_owners[idx])
+            if owner not in best:
+                best[owner] = float(score)
+            if len(best) == self.top_k:
+                break
+        return [(self.products[owner], float(np.sqrt(max(0.0, 2 - 2 * score)))) for owner, score in best.items()]
+
+    @staticmethod
+    def _top_k(scores, k):
+        """Indices of the k highest scores, best first: an O(N) partition, then a k-element sort."""
+        k = min(k, len(scores))
+        if not k:
+            return np.empty(0, dtype=np.intp)
+        top_indices = np.argpartition(-scores, k - 1)[:k]
+        return top_indices[np.argsort(-scores[top_indices])]
+
+    def _prepare_descriptions(self):
+        """Per-catalog inputs for the fuzzy matchers, built once per load."""
+        self._descriptions = [p["description"] for p in self.products]
+        # token_sort_ratio would re-tokenize and re-sort every description on each query
+        self._sorted_descriptions = [self._sort_tokens(d) for d in self._descriptions]
+
+    @staticmethod
+    def _sort_tokens(text):
+        # Lowercased, punctuation stripped, then tokens sorted; scored with processor=None
+        return " ".join(sorted(default_process(text).split()))
+
+    def _fuzzy_fallback(self, description):
+        """Top-k products by token-sort similarity, for when no semantic match is close enough."""
+        # One C++ pass over the pre-sorted catalog, spread across all cores
+        scores = process.cdist([self._sort_tokens(description)], self._sorted_descriptions, scorer=fuzz.ratio,
+                               processor=None, score_cutoff=self.minimal_fuzzy_score, workers=-1)[0]
+        return [{"id": self.products[idx]["id"], "code": self.products[idx]["code"],
+                 "description": self.products[idx]["description"], "similarity": round(float(scores[idx]), 2)}
+                for idx in self._top_k(scores, self.top_k) if scores[idx] > 0]
+
+    def _correct_input(self, description_input):
+        """Simple fuzzy correction: the closest description by fuzz.ratio (Indel similarity), if at least 60."""
+        match = process.extractOne(description_input, self._descriptions, scorer=fuzz.ratio, score_cutoff=60)
+        return match[0] if match else description_input
+
     def search_similar_products(self, description_input):
-        description_input = description_input.strip()
-        # Simple fuzzy correction
-        descriptions = [p["description"] for p in self.products]
-        matches = difflib.get_close_matches(description_input, descriptions, n=1, cutoff=0.6)
-        corrected = matches[0] if matches else description_input
+        return self.search_similar_products_batch([description_input])[0]
+
+    def search_similar_products_batch(self, descriptions):
+        """Search several descriptions at once; their embeddings share one API round trip."""
+        originals = [description.strip() for description in descriptions]
+        corrected = [self._correct_input(description) for description in originals]
+        embs = self._embed_texts(corrected) if self.products and originals else None
+        if embs is None:
+            embs = [None] * len(originals)
+        return [self._rank(original, used, emb) for original, used, emb in zip(originals, corrected, embs)]
 
+    def _rank(self, description_input, corrected, emb):
         results = {"consult_original": description_input, "consult_used": corrected, "semantics": [], "fallback_fuzzy": []}
 
-        if len(self.vectors) == 0:
+        if not self.products:
             return results
 
-        emb = self._embed_text(corrected)
-        if emb is None: return results
+        if emb is None:
+            results["fallback_fuzzy"] = self._fuzzy_fallback(corrected)
+            return results
 
-        dists = np.linalg.norm(self.vectors - emb, axis=1)
-        top_indices = np.argsort(dists)[:self.top_k]
+        if self.native_vector:
+            candidates = self._nearest_in_database(emb)
+        elif self.index is not None:
+            candidates = self._nearest_in_index(emb)
+        else:
+            scores = self.vectors @ emb
+            if len(scores) > len(self.products):
+                # Roll chunk scores up to their product, keeping the closest
+                product_scores = np.full(len(self.products), -np.inf, dtype=np.float32)
+                np.maximum.at(product_scores, self.vector_owners, scores)
+                scores = product_scores
+            # Between unit vectors, Euclidean distance follows from the dot product
+            candidates = [(self.products[idx], float(np.sqrt(max(0.0, 2 - 2 * scores[idx]))))
+                          for idx in self._top_k(scores, self.top_k)]
 
-        for idx in top_indices:
-            dist = dists[idx]
+        for match, dist in candidates:
             if dist < self.minimal_distance:
-                match = self.products[idx]
                 results["semantics"].append({
                     "id": match["id"], "code": match["code"], "description": match["description"],
                     "similarity": round((1/(1+dist)) * 100, 2)
                 })
+        if not results["semantics"]:
+            results["fallback_fuzzy"] = self._fuzzy_fallback(corrected)
         return results
     
     def close(self):
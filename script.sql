@@ -39,4 +39,10 @@ CREATE TABLE ITEM_INVOICE (
 );
 
 -- Index to accelerate searches for invoice item
-CREATE INDEX IDX_ITEM_INVOICE_EAN ON ITEM_INVOICE (CODE_EAN);
\ No newline at end of file
+CREATE INDEX IDX_ITEM_INVOICE_EAN ON ITEM_INVOICE (CODE_EAN);
+
+-- Function-based index for the case-insensitive state filter
+CREATE INDEX IDX_INVOICE_STATE_LOWER ON INVOICE (LOWER(STATE));
+
+-- Index for the unit price range filter
+CREATE INDEX IDX_ITEM_INVOICE_VALUE ON ITEM_INVOICE (VALUE_UNITARY);
\ No newline at end of file
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import os
 import sys
 import oracledb
 from mcp.server.fastmcp import FastMCP
 from product_search import SearchSimilarProduct
 from decouple import config
-from contextlib import contextmanager
+from contextlib import asynccontextmanager
 
 
 # === DB CONFIGURATION ===
@@ -13,24 +14,65 @@ DB_DSN = config('ORACLE_DSN')
 USERNAME = config('ORACLE_USER')
 PASSWORD = config('ORACLE_PASSWORD')
 
-@contextmanager
-def get_db_connection():
-    conn = None
+POOL_MIN = 2
+POOL_MAX = 10
+MAX_INVOICE_ROWS = 500  # Cap on rows returned by search_invoices_by_criteria
+
+_pool = None
+
+
+def get_pool():
+    """Create the session pool on first use, so the server still starts while Oracle is down."""
+    global _pool
+    if _pool is None:
+        # asyncio pool: tool calls waiting on Oracle no longer block the MCP event loop
+        _pool = oracledb.create_pool_async(user=USERNAME, password=PASSWORD, dsn=DB_DSN,
+                                           min=POOL_MIN, max=POOL_MAX, increment=1)
+    return _pool
+
+
+@asynccontextmanager
+async def get_db_connection():
     try:
-        conn = oracledb.connect(user=USERNAME, password=PASSWORD, dsn=DB_DSN)
-        with conn.cursor() as cursor:
-            # FIX: Use standard execute() without keyword arguments
-            cursor.execute("ALTER SESSION SET CURRENT_SCHEMA = BOOKSTORE")
-        yield conn
+        conn = await get_pool().acquire()
     except Exception as e:
         print(f"❌ Database error in context manager: {e}", file=sys.stderr)
         raise
+    # Leaving the block releases the session back to the pool however it exits
+    async with conn:
+        # Rides along with the next call instead of an ALTER SESSION round trip
+        conn.current_schema = "BOOKSTORE"
+        yield conn
+
+async def warm_pool():
+    """Open the pool's POOL_MIN sessions ahead of the first tool calls."""
+    try:
+        pool = get_pool()
+        # Held all at once, so each acquire opens its own session
+        sessions = await asyncio.gather(*(pool.acquire() for _ in range(POOL_MIN)), return_exceptions=True)
+        for session in sessions:
+            if not isinstance(session, BaseException):
+                await pool.release(session)
+        errors = [session for session in sessions if isinstance(session, BaseException)]
+        if errors:
+            raise errors[0]
+        print(f"✅ Oracle session pool ready ({POOL_MIN} sessions)", file=sys.stderr)
+    except Exception as e:
+        # Tools retry on their own calls once Oracle is reachable
+        print(f"⚠️  Oracle session pool not warmed: {e}", file=sys.stderr)
+
+
+@asynccontextmanager
+async def lifespan(server):
+    # In the background, so the MCP handshake doesn't wait on Oracle
+    warmup = asyncio.create_task(warm_pool())
+    try:
+        yield {}
     finally:
-        if conn:
-            conn.close()
+        warmup.cancel()
 
 # === INITIALIZATION ===
-mcp = FastMCP("InvoiceItemResolver")
+mcp = FastMCP("InvoiceItemResolver", lifespan=lifespan)
 
 try:
     # Initialize Searcher (triggers the fixed __init__ in product_search.py)
@@ -41,49 +83,73 @@ except Exception as e:
     searcher = None
 
 # === HELPER FUNCTIONS ===
-def execute_query(query: str, params: dict = None):
+async def execute_query(query: str, params: dict = None, commit: bool = False, cols: list = None):
+    """
+    Run a query and return its rows, as dicts keyed by cols when given.
+    Pass commit=True for DML; reads skip the extra round trip.
+    """
     if params is None: params = {}
     try:
-        with get_db_connection() as conn:
+        async with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query, params)
-                return cursor.fetchall()
+                cursor.arraysize = 1000
+                cursor.prefetchrows = 1000
+                await cursor.execute(query, params)
+                if commit:
+                    await conn.commit()
+                if not cursor.description:
+                    return []
+                if cols:
+                    # Rows are built as dicts while fetching, no second pass over the result
+                    cursor.rowfactory = lambda *row: dict(zip(cols, row))
+                return await cursor.fetchall()
     except Exception as e:
         print(f"❌ Query execution failed: {e}", file=sys.stderr)
         return []
 
 # === MCP TOOLS ===
 @mcp.tool()
-def get_system_status() -> dict:
+async def get_system_status() -> dict:
     """Returns the status of the Oracle connection and row counts."""
     try:
-        with get_db_connection() as conn:
+        async with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute("SELECT (SELECT COUNT(*) FROM products), (SELECT COUNT(*) FROM invoice) FROM DUAL")
-                res = cursor.fetchone()
+                await cursor.execute("SELECT (SELECT COUNT(*) FROM products), (SELECT COUNT(*) FROM invoice) FROM DUAL")
+                res = await cursor.fetchone()
                 return {"status": "online", "products": res[0], "invoices": res[1]}
     except Exception as e:
         return {"status": "offline", "error": str(e)}
 
 @mcp.tool()
-def search_vectorized_product(description: str) -> dict:
+async def search_vectorized_product(description: str) -> dict:
     """Searches for a product using semantic embeddings."""
     if searcher is None:
         return {"error": "Product search service not available"}
     try:
-        return searcher.search_similar_products(description)
+        # The searcher is synchronous; a worker thread keeps the event loop free
+        return await asyncio.to_thread(searcher.search_similar_products, description)
     except Exception as e:
         return {"error": f"Search failed: {str(e)}"}
 
 @mcp.tool()
-def resolve_ean(description: str) -> dict:
+async def search_vectorized_products_batch(descriptions: list[str]) -> list:
+    """Searches for several products at once; their embeddings share one API round trip."""
+    if searcher is None:
+        return [{"error": "Product search service not available"}]
+    try:
+        return await asyncio.to_thread(searcher.search_similar_products_batch, descriptions)
+    except Exception as e:
+        return [{"error": f"Search failed: {str(e)}"}]
+
+@mcp.tool()
+async def resolve_ean(description: str) -> dict:
     """Resolves EAN via advanced scoring."""
     try:
-        with get_db_connection() as conn:
+        async with get_db_connection() as conn:
             with conn.cursor() as cursor:
                 query = "SELECT code, description, similarity FROM TABLE(fn_advanced_search(:1)) ORDER BY similarity DESC"
-                cursor.execute(query, [description])
-                row = cursor.fetchone()
+                await cursor.execute(query, [description])
+                row = await cursor.fetchone()
                 if row:
                     return {"code": row[0], "description": row[1], "similarity": row[2]}
                 return {"error": "No matching EAN found"}
@@ -91,7 +157,7 @@ def resolve_ean(description: str) -> dict:
         return {"error": f"EAN resolution failed: {str(e)}"}
 
 @mcp.tool()
-def search_invoices_by_criteria(customer: str = None, state: str = None, price: float = None, ean: str = None, margin: float = 0.05) -> list:
+async def search_invoices_by_criteria(customer: str = None, state: str = None, price: float = None, ean: str = None, margin: float = 0.05) -> list:
     """Searches for A/R invoices based on multiple criteria."""
     try:
         query = """
@@ -103,11 +169,13 @@ def search_invoices_by_criteria(customer: str = None, state: str = None, price:
         """
         params = {}
         if customer:
-            query += " AND LOWER(nf.name_customer) LIKE LOWER(:customer)"
-            params["customer"] = f"%{customer}%"
+            # Binds are lowercased here so the column side is the only LOWER()
+            query += " AND LOWER(nf.name_customer) LIKE :customer"
+            params["customer"] = f"%{customer.lower()}%"
         if state:
-            query += " AND LOWER(nf.state) = LOWER(:state)"
-            params["state"] = state
+            # Served by the IDX_INVOICE_STATE_LOWER function-based index
+            query += " AND LOWER(nf.state) = :state"
+            params["state"] = state.lower()
         if ean:
             query += " AND inf.code_ean = :ean"
             params["ean"] = ean
@@ -115,10 +183,12 @@ def search_invoices_by_criteria(customer: str = None, state: str = None, price:
             query += " AND inf.value_unitary BETWEEN :price_min AND :price_max"
             params["price_min"] = price * (1 - margin)
             params["price_max"] = price * (1 + margin)
+        # Broad filters would otherwise pull every joined row into memory and into the reply
+        query += " FETCH FIRST :max_rows ROWS ONLY"
+        params["max_rows"] = MAX_INVOICE_ROWS
 
-        results = execute_query(query, params)
         cols = ["no_invoice", "name_customer", "state", "date_print", "no_item", "code_ean", "description_product", "value_unitary"]
-        return [dict(zip(cols, row)) for row in results]
+        return await execute_query(query, params, cols=cols)
     except Exception as e:
         return [{"error": f"Invoice search failed: {str(e)}"}]
 
@@ -6,9 +6,20 @@ Executes SQL files efficiently:
 - INSERT files: Execute as single script for better performance
 """
 
+import csv
+import hashlib
+import json
 import os
+import shutil
+import subprocess
+import statistics
 import sys
 import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
 from pathlib import Path
 from decouple import config
 import oracledb
@@ -19,6 +30,8 @@ import oracledb
 DB_DSN = config('ORACLE_DSN')
 USERNAME = config('ORACLE_USER')
 PASSWORD = config('ORACLE_PASSWORD')
+# Instant Client directory; only set it to force the thick driver (default is thin mode)
+ORACLE_CLIENT_LIB_DIR = config('ORACLE_CLIENT_LIB_DIR', default='')
 
 # SQL files in current directory
 SCRIPT_DIR = Path(__file__).parent
@@ -29,6 +42,43 @@ SQL_FILES = {
     "invoices": SCRIPT_DIR / "invoice_data_insert.sql"
 }
 
+# Literals in data-file statements: an ISO TO_DATE, a quoted string or an unsigned
+# number (a sign stays in the SQL, where it may be a binary minus as in qty -1)
+LITERAL_PATTERN = re.compile(
+    r"TO_DATE\(\s*'([^']*)'\s*,\s*'YYYY-MM-DD'\s*\)"
+    r"|'((?:[^']|'')*)'"
+    r"|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])",
+    re.IGNORECASE
+)
+# Only DML takes binds; DDL literals such as VARCHAR2(50) must stay in the text
+DML_PATTERN = re.compile(r"(?:INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+# Strings that can't be bound: ANSI typed literals (DATE '2025-01-01', INTERVAL '1' DAY)
+# and q'[...]' alternative quoting
+UNBINDABLE_LITERAL_PATTERN = re.compile(r"\b(?:DATE|TIMESTAMP|INTERVAL)\s*'|\bN?Q'", re.IGNORECASE)
+# A templated INSERT whose VALUES are all binds, as SQL*Loader can load it
+INSERT_TEMPLATE_PATTERN = re.compile(
+    r"INSERT\s+INTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES\s*\(\s*(:\d+(?:\s*,\s*:\d+)*)\s*\)",
+    re.IGNORECASE
+)
+EXECUTEMANY_BATCH_SIZE = 1000  # Rows per array-DML round trip until tune_batch_size measures better
+BATCH_SIZE_CANDIDATES = (100, 500, 2000)  # executemany batch sizes timed by tune_batch_size
+BATCH_SIZE_ROUNDS = 5  # Timed passes per candidate; the median decides
+BATCH_SIZE_CACHE = Path.home() / ".oracle_mcp_batch_size"  # Tuned batch size per DSN
+PLSQL_BLOCK_SIZE = 200  # Unbatchable statements sent per anonymous PL/SQL block
+COMMIT_EVERY = 5000  # Statements per transaction in execute_sql_file_split
+DATA_TABLES = ["PRODUCTS", "INVOICE", "ITEM_INVOICE"]  # Tables filled by the bulk loads
+STREAM_CHUNK_SIZE = 1 << 20  # Characters read per chunk when streaming a data file
+
+SPLIT_CACHE_VERSION = 1  # Bump when the splitters change to invalidate .splitcache files
+
+# Statement-splitting tokens, compiled once
+PLSQL_START = r"[ \t]*(?:BEGIN|DECLARE|CREATE\s+(?:OR\s+REPLACE\s+)?(?:FUNCTION|PROCEDURE|TYPE|PACKAGE|TRIGGER))\b"
+PLSQL_MARKER_PATTERN = re.compile(r"^" + PLSQL_START, re.IGNORECASE | re.MULTILINE)
+PLSQL_START_PATTERN = re.compile(PLSQL_START, re.IGNORECASE)
+SKIP_LINES_PATTERN = re.compile(r"(?:[ \t]*(?:--[^\n]*)?(?:\n|$))*")
+SLASH_LINE_PATTERN = re.compile(r"^[ \t]*/[ \t]*$", re.MULTILINE)
+STATEMENT_END_PATTERN = re.compile(r";[ \t]*$", re.MULTILINE)
+
 class DatabaseSetup:
     """Handles Oracle database setup and population"""
     
@@ -36,6 +86,8 @@ class DatabaseSetup:
         self.dsn = dsn
         self.user = user
         self.password = password
+        self.pool = None
+        self.batch_size = EXECUTEMANY_BATCH_SIZE
         self.connection = None
         self.cursor = None
     
@@ -43,16 +95,27 @@ class DatabaseSetup:
         """Connect to Oracle Database"""
         try:
             print("🔌 Connecting to Oracle Database...")
-            oracledb.init_oracle_client(
-                lib_dir=r"C:\oracle\instantclient_23_0"
-            )
+            if ORACLE_CLIENT_LIB_DIR:
+                oracledb.init_oracle_client(lib_dir=ORACLE_CLIENT_LIB_DIR)
 
-            self.connection = oracledb.connect(
+            # Two sessions are enough for the main one plus the parallel data loads
+            self.pool = oracledb.create_pool(
                 user=self.user,
                 password=self.password,
-                dsn=self.dsn
+                dsn=self.dsn,
+                min=2,
+                max=4,
+                increment=1,
+                # Repeated statements reuse their parsed handle instead of re-preparing
+                stmtcachesize=200
             )
+            self.connection = self.pool.acquire()
+            # Loaders commit explicitly, per file or every COMMIT_EVERY statements
+            self.connection.autocommit = False
             self.cursor = self.connection.cursor()
+            # Verification and summary queries fetch in bulk
+            self.cursor.arraysize = 1000
+            self.cursor.prefetchrows = 1000
             print(f"✅ Connected to {self.dsn}")
             return True
         except Exception as e:
@@ -65,6 +128,8 @@ class DatabaseSetup:
             self.cursor.close()
         if self.connection:
             self.connection.close()
+        if self.pool:
+            self.pool.close()
         print("✅ Disconnected from database")
     
     def drop_existing_objects(self):
@@ -81,20 +146,36 @@ class DatabaseSetup:
             "DROP TYPE PRODUCT_RESULT FORCE"
         ]
         
+        # One lookup instead of a failing DROP round trip per missing object
+        names = [statement.split()[2] for statement in drop_statements]
+        binds = ", ".join(f":{i}" for i in range(1, len(names) + 1))
+        try:
+            self.cursor.execute(
+                f"SELECT object_type, object_name FROM user_objects WHERE object_name IN ({binds})",
+                names
+            )
+            existing = set(self.cursor.fetchall())
+        except oracledb.Error as e:
+            print(f"❌ Cleanup failed: {e}")
+            return False
+        
         for statement in drop_statements:
+            obj_type, obj_name = statement.split()[1:3]
+            if (obj_type, obj_name) not in existing:
+                print(f"   - {obj_name} (doesn't exist, skipped)")
+                continue
             try:
                 self.cursor.execute(statement)
-                self.connection.commit()
-                obj_name = statement.split()[2]
                 print(f"   ✓ Dropped {obj_name}")
             except oracledb.Error as e:
                 # Ignore errors if object doesn't exist
                 if "does not exist" in str(e).lower() or "ORA-04043" in str(e) or "ORA-00942" in str(e):
-                    obj_name = statement.split()[2]
                     print(f"   - {obj_name} (doesn't exist, skipped)")
                 else:
                     print(f"   ⚠ Warning: {str(e)[:80]}...")
         
+        # DROPs are DDL and commit implicitly; one commit closes the phase
+        self.connection.commit()
         print("✅ Cleanup completed")
         return True
     
@@ -111,40 +192,382 @@ class DatabaseSetup:
             print(f"❌ Error reading file {file_path}: {e}")
             return None
     
-    def execute_script_bulk(self, file_path, description):
+    def execute_script_bulk(self, file_path, description, connection=None):
         """
         Execute entire SQL file at once - splits internally but runs as fast as possible.
         No progress updates - just like running a script file in SQL*Plus or SQL Developer.
+        Runs on the given pooled connection, or the main one.
         """
+        connection = connection or self.connection
         print(f"\n📋 {description}")
         print("=" * 60)
         
-        sql_content = self.read_sql_file(file_path)
-        if not sql_content:
-            return False
-        
+        cursor = connection.cursor()
         try:
-            # Count statements for info only
-            statement_count = sql_content.count(';')
-            print(f"   📊 Executing SQL file with {statement_count:,} statements...")
-            
-            # Split and execute all at once - no progress updates, maximum speed
-            statements = [s.strip() for s in sql_content.split(';') if s.strip() and not s.strip().startswith('--')]
+            print("   📊 Executing SQL file...")
             
-            for stmt in statements:
-                if stmt:
-                    self.cursor.execute(stmt)
+            # Stream, split and execute - no progress updates, maximum speed
+            statement_count = 0
+            failed = 0
+            pending = []
+            # Statements keep their file order: only consecutive ones differing in
+            # their literals are batched together
+            for sql, rows, originals in self.group_consecutive(self.iter_sql_statements(file_path), self.batch_size):
+                statement_count += len(originals)
+                if len(rows) == 1 or not rows[0]:
+                    # Nothing to batch with executemany; sent together in PL/SQL blocks
+                    pending.extend(originals)
+                    if len(pending) >= PLSQL_BLOCK_SIZE:
+                        self.execute_as_blocks(cursor, pending)
+                        pending = []
+                    continue
+                self.execute_as_blocks(cursor, pending)
+                pending = []
+                # One array-DML round trip per run instead of one per statement
+                cursor.executemany(sql, rows, batcherrors=True)
+                for error in cursor.getbatcherrors():
+                    failed += 1
+                    print(f"   ❌ {originals[error.offset][:80]}...")
+                    print(f"   Error: {error.message}")
+            self.execute_as_blocks(cursor, pending)
+            if not statement_count:
+                print(f"❌ No statements found in {file_path}")
+                return False
+            if failed:
+                print(f"❌ {failed:,} statements failed, nothing committed")
+                return False
             
             # Single commit at the end
-            self.connection.commit()
+            connection.commit()
             
             print(f"   ✓ Successfully executed all {statement_count:,} statements")
             print(f"✅ {description} completed")
             return True
             
+        except (OSError, ValueError) as e:
+            print(f"❌ Error reading file {file_path}: {e}")
+            return False
         except oracledb.Error as e:
             print(f"❌ Error executing file: {e}")
             return False
+        finally:
+            cursor.close()
+    
+    def tune_batch_size(self):
+        """
+        Pick the fastest executemany batch size for this database by timing each
+        of BATCH_SIZE_CANDIDATES against a temporary table. The result is kept
+        per DSN in BATCH_SIZE_CACHE, so only the first setup pays for the probe.
+        """
+        print("\n⏱️  Tuning Batch Size")
+        print("=" * 60)
+        
+        try:
+            cached = json.loads(BATCH_SIZE_CACHE.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            cached = {}
+        if isinstance(cached.get(self.dsn), int):
+            self.batch_size = cached[self.dsn]
+            print(f"   ✓ Using cached batch size {self.batch_size:,} (delete {BATCH_SIZE_CACHE} to re-tune)")
+            return
+        
+        # Rows shaped like the product and invoice-item inserts
+        total = 2 * max(BATCH_SIZE_CANDIDATES)
+        sample_rows = [[i, f"LIV{i:05d}", f"Sample product description {i}", Decimal("42.50")] for i in range(total)]
+        
+        def insert_all(size):
+            start = time.perf_counter()
+            for offset in range(0, total, size):
+                self.cursor.executemany(
+                    "INSERT INTO BATCH_SIZE_PROBE VALUES (:1, :2, :3, :4)",
+                    sample_rows[offset:offset + size]
+                )
+            elapsed = time.perf_counter() - start
+            self.connection.commit()
+            return elapsed
+        
+        try:
+            # A probe table left behind by an interrupted run would fail the CREATE
+            self.cursor.execute("""
+                BEGIN
+                    EXECUTE IMMEDIATE 'DROP TABLE BATCH_SIZE_PROBE';
+                EXCEPTION
+                    WHEN OTHERS THEN
+                        IF SQLCODE != -942 THEN
+                            RAISE;
+                        END IF;
+                END;
+            """)
+            self.cursor.execute("""
+                CREATE GLOBAL TEMPORARY TABLE BATCH_SIZE_PROBE (
+                    ID NUMBER, CODE VARCHAR2(50), DESCRIPTION VARCHAR2(4000), AMOUNT NUMBER(12, 4)
+                ) ON COMMIT DELETE ROWS
+            """)
+            try:
+                # Untimed pass: the first inserts pay the parse and temp segment setup
+                insert_all(max(BATCH_SIZE_CANDIDATES))
+                timings = {size: [] for size in BATCH_SIZE_CANDIDATES}
+                for round_no in range(BATCH_SIZE_ROUNDS):
+                    # Rotate the order so no candidate always runs first
+                    shift = round_no % len(BATCH_SIZE_CANDIDATES)
+                    for size in BATCH_SIZE_CANDIDATES[shift:] + BATCH_SIZE_CANDIDATES[:shift]:
+                        timings[size].append(insert_all(size))
+                timings = {size: statistics.median(times) for size, times in timings.items()}
+                for size, elapsed in timings.items():
+                    print(f"   - {size:,} rows per batch: {total / elapsed:,.0f} rows/s")
+            finally:
+                self.connection.commit()
+                self.cursor.execute("DROP TABLE BATCH_SIZE_PROBE")
+        except oracledb.Error as e:
+            print(f"   ⚠ Probe failed, keeping batch size {self.batch_size:,}: {e}")
+            return
+        
+        self.batch_size = min(timings, key=timings.get)
+        cached[self.dsn] = self.batch_size
+        try:
+            BATCH_SIZE_CACHE.write_text(json.dumps(cached), encoding='utf-8')
+        except OSError as e:
+            print(f"   ⚠ Batch size not cached: {e}")
+        print(f"✅ Using batch size {self.batch_size:,}")
+    
+    def suspend_indexes_and_constraints(self):
+        """
+        Drop the secondary indexes and disable the foreign keys of the data tables,
+        so the bulk loads don't maintain them row by row. Returns what
+        restore_indexes_and_constraints needs to put them back, or None on failure.
+        """
+        print("\n⏸️  Suspending Indexes and Foreign Keys for Bulk Load")
+        print("=" * 60)
+        
+        binds = ", ".join(f":{i}" for i in range(1, len(DATA_TABLES) + 1))
+        try:
+            # Capture the DDL first so the indexes come back exactly as script.sql made them
+            self.cursor.execute(f"""
+                SELECT index_name, DBMS_METADATA.GET_DDL('INDEX', index_name)
+                FROM user_indexes
+                WHERE table_name IN ({binds}) AND uniqueness = 'NONUNIQUE'
+            """, DATA_TABLES)
+            indexes = [(name, ddl.read()) for name, ddl in self.cursor.fetchall()]
+            self.cursor.execute(f"""
+                SELECT table_name, constraint_name
+                FROM user_constraints
+                WHERE table_name IN ({binds}) AND constraint_type = 'R' AND status = 'ENABLED'
+            """, DATA_TABLES)
+            constraints = self.cursor.fetchall()
+            
+            for table, constraint in constraints:
+                self.cursor.execute(f"ALTER TABLE {table} DISABLE CONSTRAINT {constraint}")
+                print(f"   ✓ Disabled {constraint}")
+            for name, _ in indexes:
+                self.cursor.execute(f"DROP INDEX {name}")
+                print(f"   ✓ Dropped {name}")
+            
+            print("✅ Tables ready for bulk load")
+            return indexes, constraints
+        
+        except oracledb.Error as e:
+            print(f"❌ Suspending indexes/constraints failed: {e}")
+            return None
+    
+    def restore_indexes_and_constraints(self, suspended):
+        """Rebuild the indexes and re-enable the foreign keys dropped by suspend_indexes_and_constraints"""
+        print("\n▶️  Restoring Indexes and Foreign Keys")
+        print("=" * 60)
+        
+        indexes, constraints = suspended
+        try:
+            # One build over the loaded rows instead of per-row maintenance
+            for name, ddl in indexes:
+                self.cursor.execute(ddl)
+                print(f"   ✓ Rebuilt {name}")
+            # ENABLE validates every loaded row against its parent in one pass
+            for table, constraint in constraints:
+                self.cursor.execute(f"ALTER TABLE {table} ENABLE CONSTRAINT {constraint}")
+                print(f"   ✓ Enabled {constraint}")
+            
+            print("✅ Indexes and constraints restored")
+            return True
+        
+        except oracledb.Error as e:
+            print(f"❌ Restoring indexes/constraints failed: {e}")
+            return False
+    
+    def load_with_sqlldr(self, file_path, description):
+        """
+        Load a file of single-table INSERTs with a SQL*Loader direct path load,
+        which formats blocks itself instead of going through the SQL engine.
+        Returns None, having loaded nothing, when sqlldr isn't on the PATH or can't
+        be run, or the file holds anything else.
+        """
+        sqlldr = shutil.which("sqlldr")
+        if not sqlldr:
+            return None
+        
+        outcome = None
+        try:
+            with tempfile.TemporaryDirectory() as work_dir:
+                work_dir = Path(work_dir)
+                template = None
+                row_count = 0
+                with open(work_dir / "data.csv", 'w', encoding='utf-8', newline='') as data:
+                    # Enclosed fields keep their blanks; SQL*Loader trims unenclosed ones
+                    writer = csv.writer(data, lineterminator='\n', quoting=csv.QUOTE_ALL)
+                    # Give up at the first statement that doesn't fit, before reading on
+                    for statement in self.iter_sql_statements(file_path):
+                        sql, row = self.templatize(statement)
+                        if template is None:
+                            template = INSERT_TEMPLATE_PATTERN.fullmatch(sql)
+                            first_row = row
+                        if not template or sql != template.group(0):
+                            return None
+                        values = [
+                            value.strftime("%Y-%m-%d") if isinstance(value, datetime) else value
+                            for value in row
+                        ]
+                        # Records are newline-terminated
+                        if any(isinstance(value, str) and ('\n' in value or '\r' in value) for value in values):
+                            return None
+                        writer.writerow(values)
+                        row_count += 1
+                if template is None:
+                    return None
+                
+                table, column_list, bind_list = template.groups()
+                columns = [column.strip() for column in column_list.split(',')]
+                if len(columns) != len(bind_list.split(',')):
+                    return None
+                fields = ", ".join(
+                    f'{column} DATE "YYYY-MM-DD"' if isinstance(value, datetime)
+                    else f"{column} CHAR(4000)" if isinstance(value, str)
+                    else column
+                    for column, value in zip(columns, first_row)
+                )
+                (work_dir / "load.ctl").write_text(
+                    "LOAD DATA\n"
+                    # AL32UTF8 is real UTF-8; Oracle's UTF8 is CESU-8 and garbles 4-byte characters
+                    "CHARACTERSET AL32UTF8\n"
+                    f"INFILE '{work_dir / 'data.csv'}'\n"
+                    "APPEND\n"
+                    f"INTO TABLE {table}\n"
+                    "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"'\n"
+                    "TRAILING NULLCOLS\n"
+                    f"({fields})\n",
+                    encoding='utf-8'
+                )
+                # Credentials go in an owner-only parameter file, not on the process
+                # command line, and the file is removed however the load ends
+                par_path = work_dir / "load.par"
+                try:
+                    with os.fdopen(os.open(par_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600),
+                                   'w', encoding='utf-8') as f:
+                        # Quoted so '@' or '/' in the password don't split the connect string
+                        f.write(
+                            f'userid={self.user}/"{self.password}"@{self.dsn}\n'
+                            f"control={work_dir / 'load.ctl'}\n"
+                            f"log={work_dir / 'load.log'}\n"
+                            f"bad={work_dir / 'load.bad'}\n"
+                            "direct=true\n"
+                            "errors=0\n"
+                        )
+                    
+                    print(f"\n📋 {description}")
+                    print("=" * 60)
+                    print(f"   📊 Loading {row_count:,} rows into {table} with SQL*Loader (direct path)...")
+                    result = subprocess.run(
+                        [sqlldr, f"parfile={par_path}"],
+                        capture_output=True, text=True, errors='replace'
+                    )
+                finally:
+                    par_path.unlink(missing_ok=True)
+                outcome = result.returncode == 0
+                if not outcome:
+                    log_path = work_dir / "load.log"
+                    log = log_path.read_text(encoding='utf-8', errors='replace') if log_path.exists() else result.stdout
+                    print(f"❌ SQL*Loader failed (exit code {result.returncode}):")
+                    print(log[-2000:])
+        except (OSError, ValueError) as e:
+            if outcome is None:
+                # Nothing was loaded, so execute_script_bulk can still take the file
+                print(f"   ⚠ SQL*Loader not used for {file_path}: {e}")
+                return None
+            print(f"   ⚠ SQL*Loader work files not removed: {e}")
+        
+        if outcome:
+            print(f"   ✓ Successfully loaded all {row_count:,} rows")
+            print(f"✅ {description} completed")
+        return outcome
+    
+    def execute_script_bulk_pooled(self, file_path, description):
+        """execute_script_bulk on a session of its own, so independent files can load concurrently"""
+        # A file SQL*Loader can take needs no session here at all
+        loaded = self.load_with_sqlldr(file_path, description)
+        if loaded is not None:
+            return loaded
+        try:
+            with self.pool.acquire() as connection:
+                return self.execute_script_bulk(file_path, description, connection)
+        except oracledb.Error as e:
+            print(f"❌ {description}: no pooled session ({e})")
+            return False
+    
+    @staticmethod
+    def execute_as_blocks(cursor, statements):
+        """Run statements PLSQL_BLOCK_SIZE at a time, each group in one anonymous block round trip"""
+        for start in range(0, len(statements), PLSQL_BLOCK_SIZE):
+            chunk = statements[start:start + PLSQL_BLOCK_SIZE]
+            if len(chunk) == 1:
+                cursor.execute(chunk[0])
+                continue
+            try:
+                cursor.execute("BEGIN\n" + ";\n".join(chunk) + ";\nEND;")
+            except oracledb.DatabaseError as e:
+                # DDL can't appear in a PL/SQL block (ORA-06550); run those one by one
+                if "ORA-06550" not in str(e):
+                    raise
+                for stmt in chunk:
+                    cursor.execute(stmt)
+    
+    @staticmethod
+    def templatize(statement):
+        """
+        Turn the literals of a DML statement into binds, so statements that differ
+        only in their values share one SQL text. Returns (sql, binds).
+        """
+        if not DML_PATTERN.match(statement) or UNBINDABLE_LITERAL_PATTERN.search(statement):
+            return statement, []
+        binds = []
+        
+        def to_bind(match):
+            date, text, number = match.groups()
+            if date is not None:
+                binds.append(datetime.strptime(date, "%Y-%m-%d"))
+            elif text is not None:
+                binds.append(text.replace("''", "'"))
+            else:
+                # Decimal keeps NUMBER values exact; float would round them
+                binds.append(Decimal(number) if '.' in number else int(number))
+            return f":{len(binds)}"
+        
+        return LITERAL_PATTERN.sub(to_bind, statement), binds
+    
+    @classmethod
+    def group_consecutive(cls, statements, limit):
+        """
+        Yield (sql, bind rows, original statements) for each run of consecutive
+        statements sharing a templatize SQL text, at most `limit` long, so
+        statements keep their file order
+        """
+        sql = rows = originals = None
+        for statement in statements:
+            text, binds = cls.templatize(statement)
+            if text != sql or len(rows) >= limit:
+                if rows:
+                    yield sql, rows, originals
+                sql, rows, originals = text, [], []
+            rows.append(binds)
+            originals.append(statement)
+        if rows:
+            yield sql, rows, originals
     
     def split_sql_statements(self, sql_content):
         """
@@ -154,89 +577,29 @@ class DatabaseSetup:
         - CREATE OR REPLACE blocks (CREATE.../)
         - Regular SQL (statements ending with ;)
         """
-        statements = []
-        current_statement = []
-        in_plsql_block = False
-        begin_count = 0
+        # Quick path: without PL/SQL every statement simply ends at ';'
+        if not PLSQL_MARKER_PATTERN.search(sql_content):
+            return self.split_simple_sql(sql_content)
         
-        lines = sql_content.split('\n')
-        
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            line_stripped = line.strip()
-            line_upper = line_stripped.upper()
-            
-            # Skip standalone comments and empty lines at the start
-            if not current_statement and (not line_stripped or line_stripped.startswith('--')):
-                i += 1
-                continue
-            
-            # Detect start of PL/SQL block
-            if not in_plsql_block:
-                # Anonymous block
-                if line_upper.startswith('BEGIN'):
-                    in_plsql_block = True
-                    begin_count = 1
-                # Named block
-                elif any(kw in line_upper for kw in [
-                    'CREATE OR REPLACE FUNCTION',
-                    'CREATE OR REPLACE PROCEDURE',
-                    'CREATE OR REPLACE TYPE',
-                    'CREATE FUNCTION',
-                    'CREATE PROCEDURE',
-                    'CREATE TYPE'
-                ]):
-                    in_plsql_block = True
-                    begin_count = 0
-            
-            # Track BEGIN/END nesting in PL/SQL blocks
-            if in_plsql_block:
-                # Count BEGINs
-                if re.search(r'\bBEGIN\b', line_upper):
-                    begin_count += line_upper.count('BEGIN')
-                # Count ENDs
-                if re.search(r'\bEND\b', line_upper):
-                    # Check if it's END; or END <n>;
-                    if re.search(r'\bEND\s*;', line_upper) or re.search(r'\bEND\s+\w+\s*;', line_upper):
-                        begin_count -= 1
-            
-            current_statement.append(line)
-            
-            # Check for end of statement
-            if in_plsql_block:
-                # End of PL/SQL block is marked by / on its own line
-                if line_stripped == '/' or (line_stripped.endswith('/') and len(line_stripped) == 1):
-                    stmt = '\n'.join(current_statement[:-1]).strip()  # Exclude the /
-                    if stmt:
-                        statements.append(stmt)
-                    current_statement = []
-                    in_plsql_block = False
-                    begin_count = 0
-                # Also check if BEGIN/END balanced and next line is /
-                elif begin_count == 0 and i + 1 < len(lines) and lines[i + 1].strip() == '/':
-                    current_statement.append(lines[i + 1])
-                    stmt = '\n'.join(current_statement[:-1]).strip()  # Exclude the /
-                    if stmt:
-                        statements.append(stmt)
-                    current_statement = []
-                    in_plsql_block = False
-                    i += 1  # Skip the / line
+        statements = []
+        pos = 0
+        while True:
+            # Skip blank and comment lines in front of the next statement
+            pos = SKIP_LINES_PATTERN.match(sql_content, pos).end()
+            if pos >= len(sql_content):
+                break
+            if PLSQL_START_PATTERN.match(sql_content, pos):
+                # PL/SQL ends at a line holding only '/'; its inner ';' belong to it
+                end = SLASH_LINE_PATTERN.search(sql_content, pos)
             else:
-                # Regular SQL statement ends with ;
-                if line_stripped.endswith(';'):
-                    stmt = '\n'.join(current_statement).strip()
-                    if stmt:
-                        statements.append(stmt)
-                    current_statement = []
-            
-            i += 1
-        
-        # Add any remaining statement
-        if current_statement:
-            stmt = '\n'.join(current_statement).strip()
+                end = STATEMENT_END_PATTERN.search(sql_content, pos)
+            stop = end.start() if end else len(sql_content)
+            stmt = sql_content[pos:stop].strip()
             if stmt and stmt != '/':
                 statements.append(stmt)
+            if not end:
+                break
+            pos = end.end()
         
         return statements
     
@@ -251,45 +614,64 @@ class DatabaseSetup:
         
         try:
             # Simple split for regular SQL (DDL/DML)
-            statements = [
-                stmt.strip() 
-                for stmt in sql_content.split(';') 
-                if stmt.strip() and not stmt.strip().startswith('--')
-            ]
+            statements = self.split_cached(file_path, sql_content, self.split_simple_sql)
             
             total = len(statements)
-            print(f"   📊 Executing {total:,} statements individually...")
+            print(f"   📊 Executing {total:,} statements...")
             
             # Use progress indicators for large files
             show_progress = total > 50
             progress_interval = max(1, total // 20)  # Show 20 progress updates max
             
-            for i, statement in enumerate(statements, 1):
-                try:
-                    statement = statement.strip()
-                    if not statement:
-                        continue
-                    
-                    self.cursor.execute(statement)
-                    
-                    # Show progress for large files
-                    if show_progress and (i % progress_interval == 0 or i == total):
-                        pct = (i / total) * 100
-                        print(f"   ⏳ Progress: {i:,}/{total:,} ({pct:.1f}%)")
-                    elif not show_progress:
-                        preview = statement[:50].replace('\n', ' ')
-                        print(f"   ✓ Statement {i}/{total}: {preview}...")
-                    
-                except oracledb.Error as e:
-                    error_msg = str(e)
-                    if "does not exist" in error_msg.lower() or "ORA-04043" in error_msg:
-                        if not show_progress:
-                            print(f"   ⚠ Statement {i}: Object doesn't exist (ignored)")
-                    else:
-                        print(f"   ❌ Statement {i} failed!")
-                        print(f"   Error: {error_msg}")
-                        print(f"   Statement: {statement[:200]}...")
-                        raise
+            def executed(i, statement):
+                # Show progress for large files
+                if show_progress and (i % progress_interval == 0 or i == total):
+                    pct = (i / total) * 100
+                    print(f"   ⏳ Progress: {i:,}/{total:,} ({pct:.1f}%)")
+                elif not show_progress:
+                    preview = statement[:50].replace('\n', ' ')
+                    print(f"   ✓ Statement {i}/{total}: {preview}...")
+            
+            def ignorable(i, error_msg, statement):
+                if "does not exist" in error_msg.lower() or "ORA-04043" in error_msg:
+                    if not show_progress:
+                        print(f"   ⚠ Statement {i}: Object doesn't exist (ignored)")
+                    return True
+                print(f"   ❌ Statement {i} failed!")
+                print(f"   Error: {error_msg}")
+                print(f"   Statement: {statement[:200]}...")
+                return False
+            
+            i = 0
+            uncommitted = 0
+            # Statements run in file order; only consecutive ones differing in their
+            # literals share an array-DML round trip, with failed rows reported
+            # instead of raised
+            for sql, rows, originals in self.group_consecutive(statements, self.batch_size):
+                if len(rows) == 1 or not rows[0]:
+                    for statement in originals:
+                        i += 1
+                        try:
+                            self.cursor.execute(statement)
+                        except oracledb.Error as e:
+                            if not ignorable(i, str(e), statement):
+                                raise
+                        executed(i, statement)
+                else:
+                    self.cursor.executemany(sql, rows, batcherrors=True)
+                    for error in self.cursor.getbatcherrors():
+                        statement = originals[error.offset]
+                        if not ignorable(i + error.offset + 1, error.message, statement):
+                            raise RuntimeError(error.message)
+                    for statement in originals:
+                        i += 1
+                        executed(i, statement)
+                
+                # Bound the transaction (and its undo) on very large files
+                uncommitted += len(originals)
+                if uncommitted >= COMMIT_EVERY:
+                    self.connection.commit()
+                    uncommitted = 0
             
             self.connection.commit()
             print(f"✅ {description} completed ({total:,} statements)")
@@ -299,6 +681,66 @@ class DatabaseSetup:
             print(f"❌ Error: {e}")
             return False
     
+    @classmethod
+    def split_simple_sql(cls, sql_content):
+        """Split SQL without PL/SQL blocks on ';'"""
+        return [
+            stmt
+            for stmt in (cls.strip_leading_comments(s) for s in sql_content.split(';'))
+            if stmt
+        ]
+    
+    @classmethod
+    def iter_sql_statements(cls, file_path):
+        """Yield the ';'-separated statements of a SQL file, reading STREAM_CHUNK_SIZE characters at a time"""
+        tail = ''
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), ''):
+                # The text after the chunk's last ';' may continue in the next chunk
+                *complete, tail = (tail + chunk).split(';')
+                for s in complete:
+                    stmt = cls.strip_leading_comments(s)
+                    if stmt:
+                        yield stmt
+        stmt = cls.strip_leading_comments(tail)
+        if stmt:
+            yield stmt
+    
+    @staticmethod
+    def split_cached(file_path, sql_content, split):
+        """
+        Statements of a SQL file, reusing the split stored as JSON next to it
+        (<file>.splitcache) while the file's contents are unchanged
+        """
+        key = f"{SPLIT_CACHE_VERSION}|{split.__name__}|{sql_content}".encode('utf-8')
+        digest = hashlib.blake2b(key, digest_size=16).hexdigest()
+        cache_path = Path(file_path).with_suffix(Path(file_path).suffix + '.splitcache')
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            statements = cached["statements"]
+            if cached["digest"] == digest and all(isinstance(stmt, str) for stmt in statements):
+                return statements
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        
+        statements = split(sql_content)
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({"digest": digest, "statements": statements}, f)
+        except OSError as e:
+            print(f"   ⚠ Split cache not written: {e}")
+        return statements
+    
+    @staticmethod
+    def strip_leading_comments(statement):
+        """Drop the comment lines above a statement so the statement itself isn't skipped"""
+        statement = statement.strip()
+        # Data-file statements rarely carry comments; only those need the pattern
+        if not statement.startswith('--'):
+            return statement
+        return statement[SKIP_LINES_PATTERN.match(statement).end():].strip()
+    
     def execute_plsql_file(self, file_path, description):
         """Execute PL/SQL file with intelligent statement splitting"""
         print(f"\n📋 {description}")
@@ -309,7 +751,7 @@ class DatabaseSetup:
             return False
         
         try:
-            statements = self.split_sql_statements(sql_content)
+            statements = self.split_cached(file_path, sql_content, self.split_sql_statements)
             
             for i, statement in enumerate(statements, 1):
                 try:
@@ -321,7 +763,6 @@ class DatabaseSetup:
                     print(f"   → Statement {i}/{len(statements)}: {preview}...")
                     
                     self.cursor.execute(statement)
-                    self.connection.commit()
                     print(f"   ✓ Statement {i}/{len(statements)} executed")
                 except oracledb.Error as e:
                     error_msg = str(e)
@@ -333,6 +774,8 @@ class DatabaseSetup:
                         print(f"   Statement: {statement[:300]}...")
                         raise
             
+            # One commit for the file instead of one per statement
+            self.connection.commit()
             print(f"✅ {description} completed")
             return True
         
@@ -348,17 +791,23 @@ class DatabaseSetup:
         tables = ["PRODUCTS", "INVOICE", "ITEM_INVOICE"]
         
         try:
+            # One query for which tables exist, one for all their row counts
+            binds = ", ".join(f":{i}" for i in range(1, len(tables) + 1))
+            self.cursor.execute(
+                f"SELECT table_name FROM user_tables WHERE table_name IN ({binds})",
+                tables
+            )
+            existing = {row[0] for row in self.cursor.fetchall()}
+            counts = {}
+            if existing:
+                self.cursor.execute(" UNION ALL ".join(
+                    f"SELECT '{table}', COUNT(*) FROM {table}" for table in tables if table in existing
+                ))
+                counts = dict(self.cursor.fetchall())
+            
             for table in tables:
-                self.cursor.execute(
-                    "SELECT COUNT(*) FROM user_tables WHERE table_name = :1",
-                    [table]
-                )
-                result = self.cursor.fetchone()
-                if result[0] > 0:
-                    # Get row count
-                    self.cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                    count = self.cursor.fetchone()[0]
-                    print(f"   ✓ {table}: {count:,} rows")
+                if table in existing:
+                    print(f"   ✓ {table}: {counts[table]:,} rows")
                 else:
                     print(f"   ✗ {table}: NOT FOUND")
             
@@ -425,42 +874,30 @@ class DatabaseSetup:
         print("=" * 60)
         
         try:
-            # Products count
-            self.cursor.execute("SELECT COUNT(*) FROM PRODUCTS")
-            products_count = self.cursor.fetchone()[0]
-            print(f"   📦 Products: {products_count:,}")
+            # Every figure in one round trip
+            self.cursor.execute("""
+                SELECT p.cnt, i.cnt, it.cnt, i.total_value, i.avg_value, i.states_count, s.states
+                FROM (SELECT COUNT(*) cnt FROM PRODUCTS) p,
+                     (SELECT COUNT(*) cnt, SUM(VALUE_TOTAL) total_value, AVG(VALUE_TOTAL) avg_value,
+                             COUNT(DISTINCT STATE) states_count
+                      FROM INVOICE) i,
+                     (SELECT COUNT(*) cnt FROM ITEM_INVOICE) it,
+                     (SELECT LISTAGG(STATE, ', ') WITHIN GROUP (ORDER BY STATE) states
+                      FROM (SELECT DISTINCT STATE FROM INVOICE)) s
+            """)
+            (products_count, invoices_count, items_count,
+             total_value, avg_value, states_count, states) = self.cursor.fetchone()
             
-            # Invoices count
-            self.cursor.execute("SELECT COUNT(*) FROM INVOICE")
-            invoices_count = self.cursor.fetchone()[0]
+            print(f"   📦 Products: {products_count:,}")
             print(f"   📄 Invoices: {invoices_count:,}")
-            
-            # Invoice items count
-            self.cursor.execute("SELECT COUNT(*) FROM ITEM_INVOICE")
-            items_count = self.cursor.fetchone()[0]
             print(f"   🛍️  Invoice Items: {items_count:,}")
-            
-            # Total invoice value
-            self.cursor.execute("SELECT SUM(VALUE_TOTAL) FROM INVOICE")
-            total_value = self.cursor.fetchone()[0]
             if total_value:
                 print(f"   💰 Total Invoice Value: ${total_value:,.2f}")
-            
-            # Average invoice value
-            self.cursor.execute("SELECT AVG(VALUE_TOTAL) FROM INVOICE")
-            avg_value = self.cursor.fetchone()[0]
             if avg_value:
                 print(f"   📊 Average Invoice Value: ${avg_value:,.2f}")
-            
-            # States represented
-            self.cursor.execute("SELECT COUNT(DISTINCT STATE) FROM INVOICE")
-            states_count = self.cursor.fetchone()[0]
             print(f"   🗺️  States in Database: {states_count}")
-            
-            self.cursor.execute("SELECT DISTINCT STATE FROM INVOICE ORDER BY STATE")
-            states = [row[0] for row in self.cursor.fetchall()]
             if states:
-                print(f"      States: {', '.join(states)}")
+                print(f"      States: {states}")
             
             print("✅ Summary report completed")
             return True
@@ -507,13 +944,29 @@ class DatabaseSetup:
             self.disconnect()
             return False
         
-        # Step 6: Insert products (bulk execution for performance)
-        if not self.execute_script_bulk(SQL_FILES["products"], "Inserting Products"):
+        # Steps 6-7: Insert products and invoices (bulk execution for performance).
+        # Indexes and foreign keys are suspended meanwhile and rebuilt once afterwards
+        self.tune_batch_size()
+        suspended = self.suspend_indexes_and_constraints()
+        if suspended is None:
             self.disconnect()
             return False
         
-        # Step 7: Insert invoices (bulk execution for performance)
-        if not self.execute_script_bulk(SQL_FILES["invoices"], "Inserting Invoices and Items"):
+        # The two loads are independent, so each runs on its own pooled session
+        loaded = []
+        try:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                loads = [
+                    executor.submit(self.execute_script_bulk_pooled, SQL_FILES["products"], "Inserting Products"),
+                    executor.submit(self.execute_script_bulk_pooled, SQL_FILES["invoices"], "Inserting Invoices and Items")
+                ]
+                loaded = [load.result() for load in loads]
+        except Exception as e:
+            print(f"❌ Bulk load failed: {e}")
+        finally:
+            # Put indexes and foreign keys back even when a load failed
+            restored = self.restore_indexes_and_constraints(suspended)
+        if not loaded or not all(loaded) or not restored:
             self.disconnect()
             return False
         